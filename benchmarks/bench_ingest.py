@@ -0,0 +1,113 @@
+# Compares bytes read and wall time of the old three-read ingestion
+# (hash, then fitz.open for text, then fitz.open for the thumbnail) with the
+# single read of LoadedFile, copied as in the main process or mapped as in
+# pipeline workers.
+#
+#   python benchmarks/bench_ingest.py [--files 50] [--pages 20] [--drop-caches]
+#
+# --drop-caches (Linux, root) empties the page cache before each variant so
+# the numbers reflect cold reads, as on a network mount.
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import click
+import fitz
+
+from indexer import LoadedFile, calculate_hash
+from parser import extract_pages
+
+
+def make_corpus(folder: Path, files: int, pages: int) -> list[Path]:
+    paths = []
+    noise = os.urandom(256 * 1024)
+    for i in range(files):
+        doc = fitz.open()
+        for j in range(pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), f"file {i} page {j} lorem ipsum dolor sit amet")
+            # Incompressible attachment-like payload to give the file some weight
+            page.add_file_annot((72, 100), noise[j:] + bytes([i, j]), f"blob{j}.bin")
+        path = folder / f"doc{i}.pdf"
+        doc.save(path)
+        paths.append(path)
+    return paths
+
+
+def bytes_read() -> int:
+    try:
+        with open("/proc/self/io") as f:
+            for line in f:
+                if line.startswith("rchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def drop_page_cache() -> None:
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def thumbnail(pdf: fitz.Document) -> None:
+    pdf[0].get_pixmap(matrix=fitz.Matrix(0.3, 0.3))
+
+
+def three_reads(path: Path) -> int:
+    calculate_hash(path)
+    with fitz.open(path) as pdf:
+        extract_pages(pdf, workers=1)
+    with fitz.open(path) as pdf:
+        thumbnail(pdf)
+    return 0
+
+
+def single_read(path: Path) -> int:
+    with LoadedFile(path) as loaded:
+        extract_pages(loaded.pdf, workers=1)
+        thumbnail(loaded.pdf)
+        return 0
+
+
+def mapped_read(path: Path) -> int:
+    with LoadedFile(path, use_mmap=True) as loaded:
+        extract_pages(loaded.pdf, workers=1)
+        thumbnail(loaded.pdf)
+        # Mapped pages are faulted in, not read(), so rchar doesn't see them
+        return len(loaded.data)
+
+
+def measure(name: str, fn, paths: list[Path], cold: bool) -> None:
+    if cold:
+        drop_page_cache()
+    start_bytes = bytes_read()
+    start = time.perf_counter()
+    mapped = sum(fn(p) for p in paths)
+    elapsed = time.perf_counter() - start
+    total = bytes_read() - start_bytes + mapped
+    size = sum(p.stat().st_size for p in paths)
+    print(f"{name:12} {elapsed:8.3f}s  {total / 1024 ** 2:9.1f} MiB read  ({total / size:.2f}x file size)")
+
+
+@click.command()
+@click.option("--files", default=50, show_default=True)
+@click.option("--pages", default=20, show_default=True)
+@click.option("--drop-caches", is_flag=True, help="Empty the page cache before each variant (Linux, root)")
+def main(files, pages, drop_caches):
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(Path(tmp), files, pages)
+        size = sum(p.stat().st_size for p in paths)
+        print(f"{len(paths)} files, {size / 1024 ** 2:.1f} MiB")
+        measure("three reads", three_reads, paths, drop_caches)
+        measure("single read", single_read, paths, drop_caches)
+        measure("mapped read", mapped_read, paths, drop_caches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Latency and Python memory of a 30 result search that loads full Document
+# rows (the old Document.search) versus SearchResult records with snippets,
+# and of the same search once the text is stored per page.
+#
+#   python benchmarks/bench_search.py [--docs 2000] [--kb 200] [--runs 20]
+import os
+from pathlib import Path
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import click
+import sqlalchemy as sa
+
+import database
+from database import DBSession
+from models import Document, Page, init_db
+
+WORDS = [f"{a}{b}{c}" for a in "bcdfglmnprst" for b in "aeiou" for c in "lmnrs"]
+
+
+def fill(docs: int, kb: int, pages: bool) -> None:
+    # Same text either on the document row, as older indexes kept it, or in 3 KiB pages
+    rng = random.Random(0)
+    with DBSession() as db_session:
+        for i in range(docs):
+            words = rng.choices(WORDS, k=kb * 1024 // 6)
+            doc = Document(
+                title=f"doc{i}.pdf", description="", content="" if pages else " ".join(words),
+                sha256=f"{i:064x}", path=f"docs/doc{i}.pdf", index_timestamp=0.0
+            )
+            db_session.add(doc)
+            if pages:
+                db_session.flush()
+                Page.store(db_session, doc.id, [" ".join(words[j:j + 512]) for j in range(0, len(words), 512)])
+            if i % 100 == 0:
+                db_session.commit()
+        db_session.commit()
+
+
+def full_rows(query: str) -> list[Document]:
+    with DBSession() as db_session:
+        result = db_session.execute(sa.text("""
+            SELECT d.id, d.title, d.content, d.description, d.sha256, d.path, d.index_timestamp, d.loc,
+                   bm25(document_fts) AS rank
+            FROM document_fts f
+            JOIN document d ON d.id = f.rowid
+            WHERE document_fts MATCH :query
+            ORDER BY rank
+            LIMIT 30
+        """), {"query": f"{query}*"})
+        return [
+            Document(id=row.id, title=row.title, content=row.content, description=row.description,
+                     sha256=row.sha256, path=row.path, index_timestamp=row.index_timestamp, loc=row.loc)
+            for row in result
+        ]
+
+
+def lean_rows(query: str) -> list:
+    with DBSession() as db_session:
+        return Document.search(db_session, query, 30)
+
+
+def measure(name: str, fn, query: str, runs: int) -> None:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(query)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    results = fn(query)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    print(f"{name:10} {len(results)} hits  median {timings[len(timings) // 2] * 1000:8.2f} ms  "
+          f"peak {peak / 1024 ** 2:8.2f} MiB")
+
+
+@click.command()
+@click.option("--docs", default=2000, show_default=True)
+@click.option("--kb", default=200, show_default=True, help="Text per document")
+@click.option("--runs", default=20, show_default=True)
+@click.option("--query", default="ba", show_default=True)
+def main(docs, kb, runs, query):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        init_db()
+        fill(docs, kb, pages=False)
+        print(f"{docs} documents, {kb} KiB of text each")
+        measure("full rows", full_rows, query, runs)
+        measure("lean rows", lean_rows, query, runs)
+        # The engine holds the absolute path of the first database
+        database.get_engine().dispose()
+        database._engine = None
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        init_db()
+        fill(docs, kb, pages=True)
+        measure("pages", lean_rows, query, runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Cost of opening a DBSession and running a trivial query, with a new engine
+# per session (the old DBSession) versus the shared, pooled engine.
+#
+#   python benchmarks/bench_session.py [--iterations 500]
+import os
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import click
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+import config
+from database import DBSession
+from models import init_db
+
+
+def engine_per_session() -> Session:
+    return Session(create_engine(f"sqlite:///{config.SQLITE_FILE}"), autocommit=False, autoflush=False)
+
+
+def measure(name: str, make_session, iterations: int) -> None:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        with make_session() as db_session:
+            db_session.execute(text("SELECT count(*) FROM document")).scalar()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    p95 = timings[int(len(timings) * 0.95)]
+    print(f"{name:20} mean {mean * 1000:7.3f} ms   p95 {p95 * 1000:7.3f} ms")
+
+
+@click.command()
+@click.option("--iterations", default=500, show_default=True)
+def main(iterations):
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        init_db()
+        measure("engine per session", engine_per_session, iterations)
+        measure("shared engine", DBSession, iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Cold start of the CLI: wall time of non-GUI commands, the import time reported
+# by python -X importtime and whether any heavy module got loaded that the
+# command doesn't need. Exits with an error when a command goes over budget.
+#
+#   python benchmarks/bench_startup.py [--runs 5] [--budget-ms 250]
+import os
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+MAIN = Path(__file__).resolve().parent.parent / "main.py"
+
+# Modules that are slow to import and that only some commands use
+HEAVY = ("PySide6", "fitz", "pymupdf", "pytesseract", "tqdm", "watchdog", "PIL")
+
+# Command line, and the heavy modules it is allowed to load
+COMMANDS: list[tuple[list[str], tuple[str, ...]]] = [
+    (["--help"], ()),
+    (["stats"], ()),
+    (["init"], ()),
+    (["ocr-status"], ()),
+]
+
+# sqlalchemy alone takes a few hundred milliseconds, commands using the
+# database get that much more
+DATABASE_BUDGET_MS = 400
+
+
+def import_times(stderr: str) -> tuple[float, set[str]]:
+    # Total import time of the top level imports in ms and every module imported
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.add(name.strip().split(".")[0])
+        # Nested imports are indented below the one that triggered them
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def measure(args: list[str], cwd: Path, runs: int) -> dict:
+    env = dict(os.environ, INDEXER_CACHE_DIR=str(cwd / "cache"))
+    walls = []
+    imports_ms = 0.0
+    modules: set[str] = set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime", str(MAIN), *args],
+                              cwd=cwd, env=env, capture_output=True, text=True)
+        walls.append((time.perf_counter() - start) * 1000)
+        if proc.returncode != 0:
+            raise click.ClickException(f"{' '.join(args)} failed:\n{proc.stderr[-2000:]}")
+        imports_ms, modules = import_times(proc.stderr)
+    return {"wall_ms": min(walls), "imports_ms": imports_ms, "heavy": sorted(m for m in HEAVY if m in modules)}
+
+
+def measure_all(runs: int = 5) -> dict[str, dict]:
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        # The database commands need an index to open
+        measure(["init"], folder, 1)
+        return {" ".join(args): measure(args, folder, runs) | {"allowed": list(allowed)}
+                for args, allowed in COMMANDS}
+
+
+@click.command()
+@click.option("--runs", default=5, show_default=True, help="Best of this many runs per command")
+@click.option("--budget-ms", default=250, show_default=True, help="Import time allowed without the database")
+def main(runs, budget_ms):
+    results = measure_all(runs)
+    over = []
+    print(f"{'command':15} {'wall ms':>8} {'import ms':>10}  heavy modules")
+    for command, result in results.items():
+        print(f"{command:15} {result['wall_ms']:8.0f} {result['imports_ms']:10.0f}  {', '.join(result['heavy'])}")
+        budget = budget_ms if command in ("--help", "stats") else budget_ms + DATABASE_BUDGET_MS
+        if result["imports_ms"] > budget:
+            over.append(f"{command} imports take {result['imports_ms']:.0f} ms, budget {budget} ms")
+        unexpected = set(result["heavy"]) - set(result["allowed"])
+        if unexpected:
+            over.append(f"{command} imports {', '.join(sorted(unexpected))}")
+    if over:
+        raise click.ClickException("\n".join(over))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+# End to end benchmarks on a generated corpus: full index, no-op re-index,
+# incremental change, OCR queue, search latency, watcher throughput and CLI startup.
+# Results are printed and written as JSON; pass an earlier file as --baseline
+# to see the ratio of every number to it.
+#
+#   python benchmarks/bench_suite.py [--docs 200] [--jobs 1] [--out results.json] [--baseline old.json]
+#
+# OCR is stubbed unless --real-ocr is given, so runs don't need Tesseract.
+# The extraction cache lives in a temporary folder, every run starts cold.
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ["INDEXER_CACHE_DIR"] = tempfile.mkdtemp(prefix="indexer-bench-cache-")
+
+import click
+
+import config
+# Read as a default argument when watch is imported
+config.WATCH_DEBOUNCE_SECONDS = 0.2
+
+from bench_startup import measure_all
+from corpus import WORDS, CorpusSpec, make_corpus, make_pdf, mutate
+from database import DBSession
+from indexer import update_index
+from models import Document, init_db
+import ocr_queue
+import parser
+from repo import PAGE_SIZE
+import watch
+
+
+def stub_ocr(img, lang: str) -> str:
+    return "stub ocr text"
+
+
+def timed(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def percentiles(timings: list[float]) -> dict[str, float]:
+    timings = sorted(timings)
+
+    def at(q: float) -> float:
+        return timings[min(len(timings) - 1, int(len(timings) * q))] * 1000
+
+    return {"p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99), "max_ms": timings[-1] * 1000}
+
+
+def bench_search(searches: int) -> dict[str, dict[str, float]]:
+    rng = random.Random(0)
+    queries = {
+        "prefix": [w[:2] for w in rng.choices(WORDS, k=searches)],
+        "word": rng.choices(WORDS, k=searches),
+        "two words": [" ".join(rng.choices(WORDS, k=2)) for _ in range(searches)],
+    }
+    results = {}
+    with DBSession() as db_session:
+        for name, terms in queries.items():
+            timings = []
+            for query in terms:
+                start = time.perf_counter()
+                Document.search_page(db_session, query, PAGE_SIZE)
+                timings.append(time.perf_counter() - start)
+            results[name] = percentiles(timings)
+    return results
+
+
+def count_documents() -> int:
+    with DBSession() as db_session:
+        return db_session.query(Document.id).count()
+
+
+def bench_watcher(folder: Path, files: int) -> dict[str, float]:
+    # Time from the first file written to the last one searchable
+    watcher = watch.Watcher(Path("."))
+    watcher.start(catch_up=False)
+    before = count_documents()
+    peak_depth = 0
+    rng = random.Random(2)
+    start = time.perf_counter()
+    for i in range(files):
+        make_pdf(folder / "watched" / f"w{i}.pdf", rng, 2, False, 100)
+    while count_documents() < before + files:
+        peak_depth = max(peak_depth, len(watcher.queue))
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    watcher.stop()
+    return {
+        "files": files,
+        "seconds": elapsed,
+        "files_per_second": files / elapsed,
+        "debounce_seconds": config.WATCH_DEBOUNCE_SECONDS,
+        "peak_queue_depth": peak_depth,
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(data: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict) -> None:
+    new, old = flatten(results), flatten(baseline.get("results", {}))
+    print(f"\nCompared with {baseline.get('commit')}:")
+    for key, value in new.items():
+        if key in old and old[key]:
+            print(f"  {key:45} {old[key]:12.3f} -> {value:12.3f}  ({value / old[key]:.2f}x)")
+
+
+@click.command()
+@click.option("--docs", default=CorpusSpec.docs, show_default=True)
+@click.option("--pages", default=CorpusSpec.pages, show_default=True)
+@click.option("--scan-ratio", default=CorpusSpec.scan_ratio, show_default=True)
+@click.option("--blank-ratio", default=CorpusSpec.blank_ratio, show_default=True)
+@click.option("--large-docs", default=CorpusSpec.large_docs, show_default=True)
+@click.option("--jobs", "-j", default=1, show_default=True)
+@click.option("--changes", default=10, show_default=True, help="Files moved, modified, deleted and added each")
+@click.option("--searches", default=200, show_default=True, help="Searches per query kind")
+@click.option("--watch-files", default=50, show_default=True)
+@click.option("--real-ocr", is_flag=True, help="Run Tesseract instead of the stub")
+@click.option("--out", type=click.Path(dir_okay=False, path_type=Path))
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False, path_type=Path))
+def main(docs, pages, scan_ratio, blank_ratio, large_docs, jobs, changes, searches, watch_files, real_ocr, out, baseline):
+    if not real_ocr:
+        parser.ocr_image = stub_ocr
+    spec = CorpusSpec(docs=docs, pages=pages, scan_ratio=scan_ratio, blank_ratio=blank_ratio, large_docs=large_docs)
+    results: dict = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = Path(tmp)
+        start = time.perf_counter()
+        paths = make_corpus(folder, spec)
+        print(f"{len(paths)} files generated in {time.perf_counter() - start:.1f}s")
+        os.chdir(folder)
+        init_db()
+
+        results["full_index_s"] = timed(update_index, jobs=jobs)
+        results["ocr_queue_s"] = timed(ocr_queue.drain)
+        results["noop_reindex_s"] = timed(update_index, jobs=jobs)
+        changed = mutate(folder, changes)
+        results["incremental_s"] = timed(update_index, jobs=jobs)
+        results["incremental_ocr_queue_s"] = timed(ocr_queue.drain)
+        results["search"] = bench_search(searches)
+        results["watcher"] = bench_watcher(folder, watch_files)
+        results["documents"] = count_documents()
+        os.chdir("/")
+    results["startup"] = {
+        command: {"wall_ms": r["wall_ms"], "imports_ms": r["imports_ms"]} for command, r in measure_all(3).items()
+    }
+
+    report = {
+        "commit": git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            "docs": docs, "pages": pages, "scan_ratio": scan_ratio, "blank_ratio": blank_ratio, "large_docs": large_docs,
+            "jobs": jobs, "changes": changed, "searches": searches, "real_ocr": real_ocr,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if out:
+        out.write_text(text, encoding="utf-8")
+    if baseline:
+        compare(results, json.loads(baseline.read_text(encoding="utf-8")))
+    shutil.rmtree(os.environ["INDEXER_CACHE_DIR"], ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Synthetic PDF corpora for the benchmarks. Text pages carry random words
+# from a fixed vocabulary, image-only pages are a rendered text page pasted
+# back as a picture so they take the OCR path. Everything is seeded, the same
+# arguments give the same files.
+#
+#   python benchmarks/corpus.py OUT [--docs 200] [--pages 5] [--scan-ratio 0.2]
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import random
+import shutil
+
+import click
+import fitz
+
+WORDS = [f"{a}{b}{c}{d}" for a in "bcdfglmnprstv" for b in "aeiou" for c in "lmnrst" for d in "aeiou"]
+
+
+@dataclass
+class CorpusSpec:
+    docs: int = 200
+    pages: int = 5
+    # Share of documents that are scans, without a text layer
+    scan_ratio: float = 0.2
+    # Share of documents that also exist as a copy elsewhere
+    duplicate_ratio: float = 0.05
+    # Share of pages that are blank separators
+    blank_ratio: float = 0.05
+    large_docs: int = 2
+    large_pages: int = 300
+    words_per_page: int = 250
+    seed: int = 0
+
+
+def page_words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choices(WORDS, k=count))
+
+
+def add_text_page(doc: fitz.Document, text: str) -> None:
+    page = doc.new_page()
+    page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=10)
+
+
+def add_scanned_page(doc: fitz.Document, text: str) -> None:
+    scratch = fitz.open()
+    add_text_page(scratch, text)
+    pix = scratch[0].get_pixmap(dpi=100, colorspace=fitz.csGRAY)
+    page = doc.new_page()
+    page.insert_image(page.rect, pixmap=pix)
+    scratch.close()
+
+
+def make_pdf(path: Path, rng: random.Random, pages: int, scanned: bool, words: int,
+             blank_ratio: float = 0.0) -> None:
+    doc = fitz.open()
+    for _ in range(pages):
+        # A blank scanned page is an all white image, a blank text page is empty
+        text = "" if rng.random() < blank_ratio else page_words(rng, words)
+        (add_scanned_page if scanned else add_text_page)(doc, text)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(path)
+    doc.close()
+
+
+def make_corpus(folder: Path, spec: CorpusSpec) -> list[Path]:
+    rng = random.Random(spec.seed)
+    paths = []
+    for i in range(spec.docs):
+        scanned = rng.random() < spec.scan_ratio
+        path = folder / f"dir{i % 10}" / f"{'scan' if scanned else 'doc'}{i}.pdf"
+        make_pdf(path, rng, spec.pages, scanned, spec.words_per_page, spec.blank_ratio)
+        paths.append(path)
+    for i in range(spec.large_docs):
+        path = folder / "large" / f"large{i}.pdf"
+        make_pdf(path, rng, spec.large_pages, False, spec.words_per_page)
+        paths.append(path)
+    for path in rng.sample(paths[:spec.docs], int(spec.docs * spec.duplicate_ratio)):
+        copy = folder / "copies" / path.name
+        copy.parent.mkdir(exist_ok=True)
+        shutil.copy(path, copy)
+        paths.append(copy)
+    return paths
+
+
+def mutate(folder: Path, count: int, seed: int = 1) -> dict[str, int]:
+    # Moves, modifies, deletes and adds count files each, as between two index runs
+    rng = random.Random(seed)
+    files = sorted(p for p in folder.rglob("*.pdf") if p.parent.name != "large")
+    chosen = rng.sample(files, min(len(files), count * 3))
+    moved, modified, deleted = chosen[:count], chosen[count:count * 2], chosen[count * 2:]
+    for path in moved:
+        target = folder / "moved" / path.name
+        target.parent.mkdir(exist_ok=True)
+        os.rename(path, target)
+    for path in modified:
+        make_pdf(path, rng, 3, False, 100)
+    for path in deleted:
+        path.unlink()
+    for i in range(count):
+        make_pdf(folder / "added" / f"added{i}.pdf", rng, 3, False, 100)
+    return {"moved": len(moved), "modified": len(modified), "deleted": len(deleted), "added": count}
+
+
+@click.command()
+@click.argument("out", type=click.Path(file_okay=False, path_type=Path))
+@click.option("--docs", default=CorpusSpec.docs, show_default=True)
+@click.option("--pages", default=CorpusSpec.pages, show_default=True)
+@click.option("--scan-ratio", default=CorpusSpec.scan_ratio, show_default=True)
+@click.option("--blank-ratio", default=CorpusSpec.blank_ratio, show_default=True)
+@click.option("--large-docs", default=CorpusSpec.large_docs, show_default=True)
+@click.option("--large-pages", default=CorpusSpec.large_pages, show_default=True)
+@click.option("--seed", default=CorpusSpec.seed, show_default=True)
+def main(out, docs, pages, scan_ratio, blank_ratio, large_docs, large_pages, seed):
+    spec = CorpusSpec(docs=docs, pages=pages, scan_ratio=scan_ratio, blank_ratio=blank_ratio,
+                      large_docs=large_docs, large_pages=large_pages, seed=seed)
+    paths = make_corpus(out, spec)
+    size = sum(p.stat().st_size for p in paths)
+    print(f"{len(paths)} files, {size / 1024 ** 2:.1f} MiB in {out}")
+
+
+if __name__ == "__main__":
+    main()
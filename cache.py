@@ -0,0 +1,200 @@
+import time
+from sqlalchemy import Engine, create_engine, event, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+import sqlalchemy as sa
+
+import config
+from database import dispose_after_fork, set_pragmas
+
+
+class CacheBase(DeclarativeBase):
+    pass
+
+
+class CachedDocument(CacheBase):
+    __tablename__ = 'cached_document'
+    sha256: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+    # Page texts joined with PAGE_SEPARATOR
+    content: Mapped[str | None] = mapped_column(sa.Text)
+    # Tells no pages apart from a single empty one
+    page_count: Mapped[int] = mapped_column(sa.Integer, default=0)
+    thumb: Mapped[bytes | None] = mapped_column(sa.LargeBinary)
+    size: Mapped[int] = mapped_column(sa.Integer, default=0)
+    last_used: Mapped[float] = mapped_column(sa.Float, index=True)
+
+
+PAGE_SEPARATOR = "\f"
+
+
+class CachedPage(CacheBase):
+    __tablename__ = 'cached_page'
+    page_hash: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+    text: Mapped[str] = mapped_column(sa.Text)
+    size: Mapped[int] = mapped_column(sa.Integer, default=0)
+    last_used: Mapped[float] = mapped_column(sa.Float, index=True)
+
+
+class CacheTotal(CacheBase):
+    # Bytes held by both tables in a single row, kept up to date by triggers
+    # so a put doesn't have to add up every entry
+    __tablename__ = 'cache_total'
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    size: Mapped[int] = mapped_column(sa.Integer, default=0)
+
+
+TOTAL_TRIGGERS = {
+    "cached_document_total_ai": "AFTER INSERT ON cached_document BEGIN "
+                                "UPDATE cache_total SET size = size + new.size WHERE id = 1; END",
+    "cached_document_total_au": "AFTER UPDATE OF size ON cached_document BEGIN "
+                                "UPDATE cache_total SET size = size + new.size - old.size WHERE id = 1; END",
+    "cached_document_total_ad": "AFTER DELETE ON cached_document BEGIN "
+                                "UPDATE cache_total SET size = size - old.size WHERE id = 1; END",
+    "cached_page_total_ai": "AFTER INSERT ON cached_page BEGIN "
+                            "UPDATE cache_total SET size = size + new.size WHERE id = 1; END",
+    "cached_page_total_ad": "AFTER DELETE ON cached_page BEGIN "
+                            "UPDATE cache_total SET size = size - old.size WHERE id = 1; END",
+}
+
+
+class ExtractionCache:
+    # Extracted text and thumbnails keyed by file sha256, and OCR text keyed by
+    # page content hash. Least recently used entries are evicted past max_bytes.
+
+    def __init__(self, path=config.CACHE_FILE, max_bytes: int = config.CACHE_MAX_BYTES) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.engine: Engine = create_engine(
+            f"sqlite:///{path}", connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT}
+        )
+        # Several indexing processes may share the cache
+        event.listen(self.engine, "connect", set_pragmas)
+        dispose_after_fork(self.engine)
+        try:
+            CacheBase.metadata.create_all(self.engine)
+        except OperationalError:
+            # Another process created the tables between the check and the CREATE
+            CacheBase.metadata.create_all(self.engine)
+        self._upgrade()
+
+    def _upgrade(self) -> None:
+        with self.engine.begin() as conn:
+            for name, body in TOTAL_TRIGGERS.items():
+                conn.execute(sa.text(f"CREATE TRIGGER IF NOT EXISTS {name} {body}"))
+            # Caches created before the total was kept are added up once. Entries
+            # put meanwhile by other processes are in the sum, the triggers only
+            # start counting once the row exists.
+            conn.execute(sa.text(
+                "INSERT OR IGNORE INTO cache_total(id, size) SELECT 1, "
+                "(SELECT coalesce(sum(size), 0) FROM cached_document) + (SELECT coalesce(sum(size), 0) FROM cached_page)"
+            ))
+
+    def get_content(self, sha256: str) -> list[str] | None:
+        # Text of each page
+        with Session(self.engine) as session:
+            entry = session.get(CachedDocument, sha256)
+            if entry is None or entry.content is None:
+                return None
+            pages = entry.content.split(PAGE_SEPARATOR) if entry.page_count else []
+            entry.last_used = time.time()
+            session.commit()
+            return pages
+
+    def get_thumb(self, sha256: str) -> bytes | None:
+        with Session(self.engine) as session:
+            entry = session.get(CachedDocument, sha256)
+            if entry is None or entry.thumb is None:
+                return None
+            entry.last_used = time.time()
+            session.commit()
+            return entry.thumb
+
+    def put_content(self, sha256: str, pages: list[str]) -> None:
+        self._put_document(sha256, content=PAGE_SEPARATOR.join(pages), page_count=len(pages))
+
+    def put_thumb(self, sha256: str, thumb: bytes) -> None:
+        self._put_document(sha256, thumb=thumb)
+
+    def _put_document(self, sha256: str, **values) -> None:
+        stmt = insert(CachedDocument).values(sha256=sha256, last_used=time.time(), **values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CachedDocument.sha256],
+            set_={**values, "last_used": stmt.excluded.last_used},
+        )
+        size = (
+            func.length(sa.cast(func.coalesce(CachedDocument.content, ""), sa.LargeBinary))
+            + func.coalesce(func.length(CachedDocument.thumb), 0)
+        )
+        with Session(self.engine) as session:
+            session.execute(stmt)
+            session.execute(update(CachedDocument).where(CachedDocument.sha256 == sha256).values(size=size))
+            session.commit()
+        self.evict()
+
+    def get_pages(self, page_hashes: list[str]) -> dict[str, str]:
+        if not page_hashes:
+            return {}
+        with Session(self.engine) as session:
+            entries = session.scalars(select(CachedPage).where(CachedPage.page_hash.in_(page_hashes))).all()
+            found = {e.page_hash: e.text for e in entries}
+            if found:
+                session.execute(
+                    update(CachedPage).where(CachedPage.page_hash.in_(found)).values(last_used=time.time())
+                )
+                session.commit()
+            return found
+
+    def put_pages(self, pages: dict[str, str]) -> None:
+        if not pages:
+            return
+        now = time.time()
+        rows = [
+            {"page_hash": page_hash, "text": text, "size": len(text.encode()), "last_used": now}
+            for page_hash, text in pages.items()
+        ]
+        stmt = insert(CachedPage).on_conflict_do_nothing(index_elements=[CachedPage.page_hash])
+        with Session(self.engine) as session:
+            session.execute(stmt, rows)
+            session.commit()
+        self.evict()
+
+    def total_size(self) -> int:
+        with Session(self.engine) as session:
+            return session.scalar(select(CacheTotal.size).where(CacheTotal.id == 1)) or 0
+
+    def evict(self) -> None:
+        total = self.total_size()
+        if total <= self.max_bytes:
+            return
+        # Drop down to 90% of the cap so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        entries = sa.union_all(
+            select(sa.literal("d").label("kind"), CachedDocument.sha256.label("key"),
+                   CachedDocument.size, CachedDocument.last_used),
+            select(sa.literal("p").label("kind"), CachedPage.page_hash.label("key"),
+                   CachedPage.size, CachedPage.last_used),
+        ).subquery()
+        with Session(self.engine) as session:
+            doc_keys: list[str] = []
+            page_keys: list[str] = []
+            for row in session.execute(select(entries).order_by(entries.c.last_used)):
+                if total <= target:
+                    break
+                (doc_keys if row.kind == "d" else page_keys).append(row.key)
+                total -= row.size
+            for i in range(0, len(doc_keys), 500):
+                session.execute(sa.delete(CachedDocument).where(CachedDocument.sha256.in_(doc_keys[i:i + 500])))
+            for i in range(0, len(page_keys), 500):
+                session.execute(sa.delete(CachedPage).where(CachedPage.page_hash.in_(page_keys[i:i + 500])))
+            session.commit()
+
+
+_cache: ExtractionCache | None = None
+
+
+def get_cache() -> ExtractionCache:
+    global _cache
+    if _cache is None:
+        _cache = ExtractionCache()
+    return _cache
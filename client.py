@@ -0,0 +1,36 @@
+import json
+import socket
+
+import config
+
+
+# Only the standard library is imported here, talking to a running daemon
+# must not pay for loading sqlalchemy
+
+
+def request(message: dict, path: str = str(config.SOCKET_FILE), timeout: float = 30) -> dict | None:
+    # None when no daemon is listening, or it timed out or went away mid-request
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+            sock.sendall(json.dumps(message).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+
+def search(query: str, limit: int | None = None, cursor: list | None = None) -> dict:
+    message = {"query": query, "limit": limit, "cursor": cursor}
+    response = request(message)
+    if response is not None:
+        return response
+    # No daemon, answer from the database in this process
+    from database import DBSession
+    from server import search_response
+
+    with DBSession() as db_session:
+        return search_response(db_session, message)
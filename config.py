@@ -7,4 +7,56 @@ APPDIR = Path(os.path.dirname(os.path.realpath(__file__)))
 INDEXDIR = Path("indexdir")
 THUMBSDIR = INDEXDIR / "thumbs"
 SQLITE_FILE =  INDEXDIR / "index.sqlite3"
-THUMB_PLACEHOLDER = APPDIR / "gui/assets/thumb_placeholder.png"
\ No newline at end of file
+SQLITE_CACHE_KB = 64 * 1024
+SQLITE_MMAP_BYTES = 256 * 1024 ** 2
+SQLITE_BUSY_TIMEOUT = 30
+THUMB_PLACEHOLDER = APPDIR / "gui/assets/thumb_placeholder.png"
+THUMB_SIZE = (200, 200)
+THUMB_QUALITY = 80
+
+WATCH_DEBOUNCE_SECONDS = 2.0
+WATCH_BATCH_SIZE = 50
+
+# Folders and files update-index and the watcher leave out, read from the indexed folder
+IGNORE_FILE = ".indexerignore"
+# Threads listing folders, more than one helps on network filesystems
+WALK_WORKERS = 1
+# update-index commits after this long or this much page text, whichever comes first
+COMMIT_SECONDS = 5.0
+COMMIT_BYTES = 64 * 1024 ** 2
+
+OCR_DPI = 300
+OCR_WORKERS = max(1, os.cpu_count() or 1)
+# Scans are rendered at their own resolution when lower than OCR_DPI, but not below this
+OCR_MIN_DPI = 200
+# Bitmaps of large formats are capped at this many pixels, their lettering is bigger anyway
+OCR_MAX_PIXELS = 40_000_000
+# Seconds Tesseract may spend on one page, the page is left empty after that
+OCR_PAGE_TIMEOUT = 120
+# A page rendered at OCR_PROBE_DPI with less than this share of pixels darker than
+# OCR_INK_LEVEL is blank, about two words of 10pt text on A4
+OCR_PROBE_DPI = 36
+OCR_INK_LEVEL = 224
+OCR_BLANK_INK = 0.0002
+# A lone image covering less than this share of the page is a logo or a stamp, not a scan
+OCR_LOGO_MAX_AREA = 0.05
+# Used to estimate the OCR time saved when nothing was OCR'd to measure it
+OCR_SECONDS_PER_MPX = 0.3
+
+# Extraction cache lives outside the index dir so it survives rebuilding it
+CACHEDIR = Path(os.environ.get("INDEXER_CACHE_DIR", Path.home() / ".cache/indexer"))
+CACHE_FILE = CACHEDIR / "extraction_cache.sqlite3"
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+# Timings of each update-index and ocr run
+RUNSDIR = INDEXDIR / "runs"
+RUNS_KEPT = 100
+STATS_SLOWEST_FILES = 20
+
+# Search daemon started by serve
+SOCKET_FILE = INDEXDIR / "indexer.sock"
+
+# Result pages kept per process, reused until the index changes
+SEARCH_CACHE_ENTRIES = 256
+# Queries whose full ranking is kept to serve their next pages, each holds every matching document
+SEARCH_CACHE_RANKINGS = 16
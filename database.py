@@ -1,13 +1,60 @@
+import os
 from pathlib import Path
+import weakref
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Session
-from sqlalchemy import Engine, create_engine
+from sqlalchemy import Engine, create_engine, event
 
 import config
 
 
+def set_pragmas(dbapi_conn, _) -> None:
+    # WAL lets the watcher, the GUI and a CLI update-index read and write concurrently
+    cursor = dbapi_conn.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{config.SQLITE_CACHE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_BYTES}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
 def make_engine() -> Engine:
-    return create_engine(f"sqlite:///{config.SQLITE_FILE}")
+    engine = create_engine(
+        f"sqlite:///{config.SQLITE_FILE}",
+        connect_args={"timeout": config.SQLITE_BUSY_TIMEOUT},
+    )
+    event.listen(engine, "connect", set_pragmas)
+    dispose_after_fork(engine)
+    return engine
+
+
+_engine: Engine | None = None
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        _engine = make_engine()
+    return _engine
+
+
+_forked_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def dispose_after_fork(engine: Engine) -> None:
+    # Forked worker processes must not reuse the parent's connections, the
+    # engine's pool is dropped in the child and it connects again when used
+    _forked_engines.add(engine)
+
+
+def _after_fork() -> None:
+    for engine in list(_forked_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
 
 
 class Base(DeclarativeBase):
@@ -16,7 +63,7 @@ class Base(DeclarativeBase):
 
 
 def DBSession() -> Session:
-    return Session(make_engine(), autocommit=False, autoflush=False)
+    return Session(get_engine(), autocommit=False, autoflush=False)
 
 
 
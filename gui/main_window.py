@@ -1,21 +1,23 @@
 from datetime import datetime
 from pathlib import Path
 import shutil
-import threading
 from PySide6.QtWidgets import (
-    QWidget, QVBoxLayout, QLineEdit, QScrollArea,
+    QWidget, QVBoxLayout, QLineEdit,
     QVBoxLayout, QMainWindow, QMenuBar, QMenu, QFileDialog, QInputDialog
 )
 from PySide6.QtGui import QIcon, QAction
-from PySide6.QtCore import Qt
+from PySide6.QtCore import QTimer
 
 import config
 from database import DBSession
-from gui.result_widget import ResultWidget
-from indexer import index_pdf
-from repo import search_documents
+from gui.result_list import ResultList
+from gui.search_worker import SearchWorker
+from models import SearchPage
 from utils import show_in_file_manager, startfile
-from watch import watch_folder
+from watch import Watcher
+
+
+SEARCH_DELAY_MS = 250
 
 
 def get_icon(name) -> QIcon:
@@ -29,9 +31,13 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(800, 800)
         self.setWindowIcon(get_icon("app_icon.jpg"))
 
-        # Start watch_folder in a background thread
-        self._watcher_thread = threading.Thread(target=watch_folder, daemon=True)
-        self._watcher_thread.start()
+        # Changes are indexed on the watcher's own thread
+        self.watcher = Watcher()
+        self.watcher.start()
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setInterval(1000)
+        self.watch_timer.timeout.connect(self.show_watch_status)
+        self.watch_timer.start()
 
         # Add menu bar and File menu
         menubar = QMenuBar(self)
@@ -49,32 +55,68 @@ class MainWindow(QMainWindow):
 
         # Search bar
         self.search_bar = QLineEdit()
-        self.search_bar.setPlaceholderText("Enter search query and press Enter...")
+        self.search_bar.setPlaceholderText("Type to search...")
         self.search_bar.returnPressed.connect(self.perform_search)
+        self.search_bar.textChanged.connect(self.on_text_changed)
         main_layout.addWidget(self.search_bar)
 
-        # Scrollable area for results
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.results_container = QWidget()
-        self.results_layout = QVBoxLayout()
-        self.results_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
-        self.results_container.setLayout(self.results_layout)
-        self.scroll_area.setWidget(self.results_container)
-        main_layout.addWidget(self.scroll_area)
+        # Searches run on a worker thread once typing pauses
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.perform_search)
+        self.search_worker = SearchWorker()
+        self.search_worker.results_ready.connect(self.on_results)
 
-    def perform_search(self) -> None:
-        query = self.search_bar.text().strip()
-        docs = search_documents(query)
+        # Results list, only the visible rows are painted
+        self.result_list = ResultList()
+        self.result_list.verticalScrollBar().valueChanged.connect(self.on_scroll)
+        main_layout.addWidget(self.result_list)
 
-        for i in reversed(range(self.results_layout.count())):
-            widget = self.results_layout.itemAt(i).widget()
-            if widget:
-                widget.setParent(None)
+        self.query = ""
+        self.cursor: tuple[float, int] | None = None
 
-        for doc in docs:
-            widget = ResultWidget(doc)
-            self.results_layout.addWidget(widget)
+    def on_text_changed(self, _text: str) -> None:
+        self.search_timer.start()
+
+    def perform_search(self) -> None:
+        self.search_timer.stop()
+        self.query = self.search_bar.text().strip()
+        self.cursor = None
+        if not self.query:
+            self.search_worker.cancel()
+            self.clear_results()
+            return
+        self.search_worker.search(self.query)
+
+    def on_results(self, request_id: int, page: SearchPage, append: bool) -> None:
+        if not self.search_worker.is_current(request_id):
+            return
+        if not append:
+            self.clear_results()
+        self.add_results(page)
+
+    def clear_results(self) -> None:
+        self.result_list.clear()
+
+    def add_results(self, page: SearchPage) -> None:
+        self.cursor = page.cursor
+        self.result_list.append(page.results)
+        # Results that don't fill the view leave nothing to scroll
+        QTimer.singleShot(0, lambda: self.on_scroll(self.result_list.verticalScrollBar().value()))
+
+    def on_scroll(self, value: int) -> None:
+        # Fetch the next page when the last screenful of results comes into view
+        scrollbar = self.result_list.verticalScrollBar()
+        if self.cursor is not None and value >= scrollbar.maximum() - scrollbar.pageStep():
+            cursor, self.cursor = self.cursor, None
+            self.search_worker.search(self.query, cursor)
+
+    def show_watch_status(self) -> None:
+        if len(self.watcher.queue) or self.watcher.catching_up:
+            self.statusBar().showMessage(self.watcher.status())
+        else:
+            self.statusBar().clearMessage()
 
     def open_folder(self):
         show_in_file_manager(".")
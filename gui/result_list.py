@@ -0,0 +1,265 @@
+import html
+from pathlib import Path
+from PySide6.QtWidgets import (
+    QHBoxLayout, QVBoxLayout, QLabel, QListView, QMenu, QSpinBox, QStyle, QStyledItemDelegate,
+    QStyleOptionViewItem, QTextEdit, QDialog, QDialogButtonBox, QLineEdit
+)
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QPersistentModelIndex, QRect, QSize, Qt
+from PySide6.QtGui import QColor, QFont, QFontMetrics, QPainter, QTextDocument
+from sqlalchemy import update
+
+from database import DBSession
+from gui.thumb_loader import THUMB_SIZE, ThumbLoader
+from models import MATCH_END, MATCH_START, Document, Meta, Page, SearchResult
+from utils import show_in_file_manager, startfile
+
+
+RESULT_ROLE = Qt.ItemDataRole.UserRole
+ROW_HEIGHT = 130
+MARGIN = 8
+
+
+def snippet_html(result: SearchResult) -> str:
+    snippet = html.escape(" ".join(result.snippet.split()))
+    return snippet.replace(MATCH_START, "<b>").replace(MATCH_END, "</b>")
+
+
+def pages_text(result: SearchResult) -> str:
+    if result.page is None:
+        return ""
+    if result.page_hits > 1:
+        return f"Page {result.page}, {result.page_hits - 1} more matching page(s)"
+    return f"Page {result.page}"
+
+
+class ResultModel(QAbstractListModel):
+    # Search results as plain records, rows are only painted while visible
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.results: list[SearchResult] = []
+        self._rows_by_sha: dict[str, list[int]] = {}
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.results)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        result = self.results[index.row()]
+        if role == RESULT_ROLE:
+            return result
+        if role == Qt.ItemDataRole.DisplayRole:
+            return result.title
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return result.path
+        return None
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self.results = []
+        self._rows_by_sha = {}
+        self.endResetModel()
+
+    def append(self, results: list[SearchResult]) -> None:
+        if not results:
+            return
+        first = len(self.results)
+        self.beginInsertRows(QModelIndex(), first, first + len(results) - 1)
+        for row, result in enumerate(results, first):
+            self.results.append(result)
+            self._rows_by_sha.setdefault(result.sha256, []).append(row)
+        self.endInsertRows()
+
+    def refresh_sha(self, sha256: str) -> None:
+        for row in self._rows_by_sha.get(sha256, []):
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def refresh(self, row: int) -> None:
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+
+
+class ResultDelegate(QStyledItemDelegate):
+
+    def __init__(self, thumbs: ThumbLoader, parent=None) -> None:
+        super().__init__(parent)
+        self.thumbs = thumbs
+        self._snippet = QTextDocument()
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex | QPersistentModelIndex) -> QSize:
+        return QSize(option.rect.width(), ROW_HEIGHT)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex | QPersistentModelIndex) -> None:
+        result: SearchResult = index.data(RESULT_ROLE)
+        painter.save()
+        rect = option.rect
+        if option.state & QStyle.StateFlag.State_Selected:
+            painter.fillRect(rect, QColor("#cfe2f3"))
+        elif option.state & QStyle.StateFlag.State_MouseOver:
+            painter.fillRect(rect, QColor("#e0e0e0"))
+        else:
+            painter.fillRect(rect, QColor("white"))
+        painter.setPen(QColor("#c0c0c0"))
+        painter.drawLine(rect.bottomLeft(), rect.bottomRight())
+
+        # Placeholder until the thumbnail is decoded, the view repaints the row then
+        pixmap = self.thumbs.get(result.sha256, result.thumb) or self.thumbs.placeholder
+        thumb_rect = QRect(rect.left() + MARGIN, rect.top() + MARGIN, THUMB_SIZE, THUMB_SIZE)
+        painter.drawPixmap(
+            thumb_rect.left() + (THUMB_SIZE - pixmap.width()) // 2,
+            thumb_rect.top() + (THUMB_SIZE - pixmap.height()) // 2,
+            pixmap
+        )
+
+        left = thumb_rect.right() + MARGIN * 2
+        width = rect.right() - MARGIN - left
+        top = rect.top() + MARGIN
+        painter.setPen(option.palette.color(option.palette.ColorRole.Text))
+        loc = "  ·  ".join(text for text in (result.loc, pages_text(result)) if text)
+        lines = [(result.title, True), (result.path, False), (loc, False)]
+        for text, bold in lines:
+            font = QFont(option.font)
+            font.setBold(bold)
+            painter.setFont(font)
+            metrics = QFontMetrics(font)
+            text = metrics.elidedText(text, Qt.TextElideMode.ElideMiddle, width)
+            painter.drawText(QRect(left, top, width, metrics.height()), Qt.AlignmentFlag.AlignLeft, text)
+            top += metrics.height() + 2
+
+        self._snippet.setDefaultFont(option.font)
+        self._snippet.setHtml(snippet_html(result))
+        self._snippet.setTextWidth(width)
+        painter.translate(left, top)
+        painter.setClipRect(QRect(0, 0, width, rect.bottom() - MARGIN - top))
+        self._snippet.drawContents(painter)
+        painter.restore()
+
+
+class ResultList(QListView):
+    # Replaces one widget per result: the model holds the records and the
+    # delegate paints whichever rows are on screen.
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.thumbs = ThumbLoader(parent=self)
+        self.result_model = ResultModel(self)
+        self.thumbs.thumb_ready.connect(self.result_model.refresh_sha)
+        self.setModel(self.result_model)
+        self.setItemDelegate(ResultDelegate(self.thumbs, self))
+        self.setUniformItemSizes(True)
+        self.setVerticalScrollMode(QListView.ScrollMode.ScrollPerPixel)
+        self.setMouseTracking(True)
+        self.doubleClicked.connect(self.open_result)
+
+    def clear(self) -> None:
+        self.thumbs.clear_pending()
+        self.result_model.clear()
+
+    def append(self, results: list[SearchResult]) -> None:
+        self.result_model.append(results)
+
+    def open_result(self, index: QModelIndex) -> None:
+        result: SearchResult = index.data(RESULT_ROLE)
+        startfile((Path(".") / result.path).absolute(), result.page)
+
+    def contextMenuEvent(self, event):
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            return
+        doc: SearchResult = index.data(RESULT_ROLE)
+        menu = QMenu(self)
+        open_action = menu.addAction("Open")
+        show_action = menu.addAction("Show in folder")
+        edit_desc_action = menu.addAction("Edit description")
+        set_loc_action = menu.addAction("Set location")
+        show_content_action = menu.addAction("Show content")
+        action = menu.exec(event.globalPos())
+        if action == open_action:
+            startfile((Path(".") / doc.path).absolute(), doc.page)
+        elif action == show_action:
+            show_in_file_manager((Path(".") / doc.path).absolute())
+        elif action == edit_desc_action:
+            self.edit_description(doc)
+        elif action == set_loc_action:
+            self.set_location(doc, index.row())
+        elif action == show_content_action:
+            self.show_content(doc)
+
+    def edit_description(self, doc: SearchResult) -> None:
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Edit Description")
+        dialog.resize(500, 300)
+        layout = QVBoxLayout(dialog)
+        text_edit = QTextEdit(dialog)
+        with DBSession() as db_session:
+            text_edit.setPlainText(Document.get_description(db_session, doc.id))
+        layout.addWidget(text_edit)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel, dialog)
+        layout.addWidget(buttons)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            description = text_edit.toPlainText()
+            with DBSession() as db_session:
+                db_session.execute(update(Document).where(Document.id == doc.id).values(description=description))
+                Meta.bump_generation(db_session)
+                db_session.commit()
+
+    def set_location(self, doc: SearchResult, row: int) -> None:
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Set Location")
+        dialog.resize(400, 120)
+        layout = QVBoxLayout(dialog)
+        layout.addWidget(QLabel("Location:"))
+        loc_edit = QLineEdit(dialog)
+        loc_edit.setText(doc.loc or "")
+        layout.addWidget(loc_edit)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel, dialog)
+        layout.addWidget(buttons)
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            doc.loc = loc_edit.text()
+            with DBSession() as db_session:
+                db_session.execute(update(Document).where(Document.id == doc.id).values(loc=doc.loc))
+                Meta.bump_generation(db_session)
+                db_session.commit()
+            self.result_model.refresh(row)
+
+    def show_content(self, doc: SearchResult) -> None:
+        dialog = QDialog(self)
+        dialog.setWindowTitle("Content")
+        dialog.resize(600, 800)
+        layout = QVBoxLayout(dialog)
+        text_edit = QTextEdit(dialog)
+        text_edit.setReadOnly(True)
+        # One page is loaded at a time, starting with the best match
+        with DBSession() as db_session:
+            numbers = Page.numbers(db_session, doc.id)
+
+        def load_page(number: int | None) -> None:
+            with DBSession() as db_session:
+                text_edit.setPlainText(Page.get_text(db_session, doc.id, number))
+
+        page_numbers = [n for n in numbers if n is not None]
+        if None in numbers or not page_numbers:
+            load_page(None)
+        else:
+            page_row = QHBoxLayout()
+            page_row.addWidget(QLabel("Page:"))
+            page_box = QSpinBox(dialog)
+            page_box.setRange(min(page_numbers), max(page_numbers))
+            page_box.setSuffix(f" / {max(page_numbers)}")
+            page_box.setValue(doc.page or min(page_numbers))
+            page_box.valueChanged.connect(load_page)
+            page_row.addWidget(page_box)
+            page_row.addStretch()
+            layout.addLayout(page_row)
+            load_page(page_box.value())
+        layout.addWidget(text_edit)
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok, dialog)
+        layout.addWidget(buttons)
+        buttons.accepted.connect(dialog.accept)
+        dialog.exec()
@@ -0,0 +1,76 @@
+import logging
+import threading
+from PySide6.QtCore import QObject, Signal
+from sqlalchemy.engine.interfaces import DBAPIConnection
+from sqlalchemy.exc import OperationalError
+
+from database import DBSession
+from repo import PAGE_SIZE, search_cache
+
+
+class SearchWorker(QObject):
+    # Runs searches on a background thread. Only the latest request matters: a new
+    # one interrupts the SQLite query in flight and results of older ones are dropped.
+    results_ready = Signal(int, object, bool)  # request id, SearchPage, next page of the previous results
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._cond = threading.Condition()
+        self._pending: tuple[int, str, tuple[float, int] | None] | None = None
+        self._request_id = 0
+        # Connection of the search in flight, interrupted by a newer request
+        self._connection: DBAPIConnection | None = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def search(self, query: str, cursor: tuple[float, int] | None = None) -> int:
+        with self._cond:
+            self._request_id += 1
+            self._pending = (self._request_id, query, cursor)
+            if self._connection is not None:
+                self._connection.interrupt()
+            self._cond.notify()
+            return self._request_id
+
+    def cancel(self) -> None:
+        with self._cond:
+            self._request_id += 1
+            self._pending = None
+            if self._connection is not None:
+                self._connection.interrupt()
+
+    def is_current(self, request_id: int) -> bool:
+        return request_id == self._request_id
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                request_id, query, cursor = self._pending
+                self._pending = None
+            try:
+                page = self._execute(request_id, query, cursor)
+            except OperationalError as e:
+                # Interrupted by a newer request
+                if self.is_current(request_id):
+                    logging.error(f"Search for {query!r} failed: {e}")
+                continue
+            except Exception as e:
+                logging.error(f"Search for {query!r} failed: {e}")
+                continue
+            if page is not None and self.is_current(request_id):
+                self.results_ready.emit(request_id, page, cursor is not None)
+
+    def _execute(self, request_id: int, query: str, cursor: tuple[float, int] | None):
+        with DBSession() as db_session:
+            connection = db_session.connection().connection.dbapi_connection
+            with self._cond:
+                if not self.is_current(request_id):
+                    return None
+                self._connection = connection
+            try:
+                return search_cache.search_page(db_session, query, PAGE_SIZE, cursor)
+            finally:
+                with self._cond:
+                    self._connection = None
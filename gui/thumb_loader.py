@@ -0,0 +1,75 @@
+from collections import OrderedDict
+from pathlib import Path
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Qt, Signal
+from PySide6.QtGui import QImage, QPixmap
+
+import config
+
+
+THUMB_SIZE = 100
+THUMB_CACHE_ENTRIES = 500
+
+
+class _Signals(QObject):
+    loaded = Signal(str, QImage)
+
+
+class _LoadThumb(QRunnable):
+    def __init__(self, sha256: str, path: Path, signals: _Signals) -> None:
+        super().__init__()
+        self.sha256 = sha256
+        self.path = path
+        self.signals = signals
+
+    def run(self) -> None:
+        # QImage, unlike QPixmap, can be decoded off the GUI thread
+        image = QImage(str(self.path))
+        if not image.isNull():
+            image = image.scaled(
+                THUMB_SIZE, THUMB_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+                Qt.TransformationMode.SmoothTransformation
+            )
+        self.signals.loaded.emit(self.sha256, image)
+
+
+class ThumbLoader(QObject):
+    # Decodes thumbnails on a thread pool and keeps the most recently used
+    # pixmaps, keyed by sha256 so duplicates share one entry.
+    thumb_ready = Signal(str)
+
+    def __init__(self, max_entries: int = THUMB_CACHE_ENTRIES, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+        self.max_entries = max_entries
+        self._pixmaps: OrderedDict[str, QPixmap] = OrderedDict()
+        self._pending: set[str] = set()
+        self._pool = QThreadPool(self)
+        self._signals = _Signals(self)
+        self._signals.loaded.connect(self._on_loaded)
+        self.placeholder = QPixmap(str(config.THUMB_PLACEHOLDER)).scaled(
+            THUMB_SIZE, THUMB_SIZE, Qt.AspectRatioMode.KeepAspectRatio,
+            Qt.TransformationMode.SmoothTransformation
+        )
+
+    def get(self, sha256: str, path: Path) -> QPixmap | None:
+        pixmap = self._pixmaps.get(sha256)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(sha256)
+            return pixmap
+        if sha256 not in self._pending:
+            self._pending.add(sha256)
+            self._pool.start(_LoadThumb(sha256, path, self._signals))
+        return None
+
+    def clear_pending(self) -> None:
+        # Rows scrolled past before their thumbnail was decoded don't need it anymore
+        self._pool.clear()
+        self._pending.clear()
+
+    def _on_loaded(self, sha256: str, image: QImage) -> None:
+        self._pending.discard(sha256)
+        # Missing thumbnails are cached as the placeholder so they aren't retried on every paint
+        self._pixmaps[sha256] = self.placeholder if image.isNull() else QPixmap.fromImage(image)
+        self._pixmaps.move_to_end(sha256)
+        while len(self._pixmaps) > self.max_entries:
+            self._pixmaps.popitem(last=False)
+        self.thumb_ready.emit(sha256)
@@ -1,53 +1,136 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 import hashlib
+import io
 import logging
+import mmap
+import os
 from pathlib import Path
-from typing import Literal
-from sqlalchemy import delete, or_
+import time
+from typing import Iterator, Literal, NamedTuple
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import Session
+from cache import get_cache
+import config
 from database import DBSession
-from models import Document
-from parser import extract_text_with_ocr
+from models import Document, IndexRun, IndexRunFile, Meta, OcrJob, Page
+from ocr_queue import FILE_MISSING
+from parser import extract_pages, ocr_savings
+from run_stats import FileTimer, RunStats
+from walk import walk_pdfs
 import fitz
 from PIL import Image
-from tqdm import tqdm
 
 
-def generate_pdf_thumbnail(doc: Document, size=(200, 200)) -> None:
+def render_thumbnail(pdf: fitz.Document, size=config.THUMB_SIZE) -> bytes:
+    page = pdf[0]
+    # Render straight into the target box instead of downsampling a large bitmap
+    zoom = min(size[0] / max(page.rect.width, 1), size[1] / max(page.rect.height, 1))
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+    img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=config.THUMB_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_pdf_thumbnail(doc: Document, size=config.THUMB_SIZE, pdf: fitz.Document | None = None) -> None:
     thumbnail_path = doc.thumb
-    if doc.thumb.is_file():
+    if thumbnail_path.is_file():
         return
+    thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+    cache = get_cache()
+    data = cache.get_thumb(doc.sha256)
+    if data is None:
+        if pdf is not None:
+            data = render_thumbnail(pdf, size)
+        else:
+            with fitz.open(Path(doc.path)) as pdf_doc:
+                data = render_thumbnail(pdf_doc, size)
+        cache.put_thumb(doc.sha256, data)
+    thumbnail_path.write_bytes(data)
+
+
+def delete_thumbnail(doc: Document) -> None:
     try:
-        thumbnail_path.parent.mkdir(parents=True)
-    except FileExistsError:
+        doc.thumb.unlink()
+    except FileNotFoundError:
         pass
-    pdf_path = Path(doc.path)
 
-    pdf_doc = fitz.open(pdf_path)
-    page = pdf_doc[0]
 
-    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)  # type: ignore
+class FileStat(NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
 
-    img.thumbnail(size, Image.LANCZOS)  # type: ignore
+    @classmethod
+    def of(cls, path: Path) -> "FileStat":
+        return cls.from_stat(path.stat())
 
-    img.save(thumbnail_path)
-    pdf_doc.close()
+    @classmethod
+    def from_stat(cls, st: os.stat_result) -> "FileStat":
+        return cls(st.st_size, st.st_mtime_ns, st.st_ino)
 
 
-def delete_thumbnail(doc: Document) -> None:
-    try:
-        doc.thumb.unlink()
-    except FileNotFoundError:
-        pass
+@dataclass
+class Entry:
+    id: int | None
+    path: str
+    sha256: str
+    stat: tuple[int | None, int | None, int | None]
 
 
 @dataclass
 class Res:
-    doc: Document
     action:  Literal['same', 'moved', 'duplicated', 'new', 'modified']
     sha256: str
+    stat: FileStat
+    # Existing row the file maps to
+    entry: Entry | None = None
+    # Row whose pages hold the text of the same bytes
+    copy_from: int | None = None
+
+
+class LoadedFile:
+    # The file is read once; hashing, text extraction and the thumbnail all
+    # read from the same buffer instead of opening the file again.
+    # With use_mmap the file is mapped instead of copied. A mapped file cut
+    # short while it is read kills the process with SIGBUS, so only worker
+    # processes, whose death the pipeline recovers from, map files.
+
+    def __init__(self, path: Path, use_mmap: bool = False) -> None:
+        self.path = path
+        self._mmap: mmap.mmap | None = None
+        with path.open("rb") as f:
+            if use_mmap and os.fstat(f.fileno()).st_size:
+                # The mapping stays valid once the file is closed
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.data = memoryview(self._mmap)
+            else:
+                self.data = memoryview(f.read())
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self._pdf: fitz.Document | None = None
+
+    @property
+    def pdf(self) -> fitz.Document:
+        if self._pdf is None:
+            self._pdf = fitz.open(str(self.path), stream=self.data, filetype="pdf")
+        return self._pdf
+
+    def close(self) -> None:
+        if self._pdf is not None:
+            self._pdf.close()
+        self.data.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self) -> "LoadedFile":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
 
 def calculate_hash(path: Path) -> str:
@@ -58,105 +141,437 @@ def calculate_hash(path: Path) -> str:
     return sha256.hexdigest()
 
 
-def analise_file(db_session: Session, path: str | Path) -> Res:
-    path = Path(path)
-    pathstr = path.as_posix()
-    hash = calculate_hash(path)
-
-    doc = db_session.query(Document).where(
-        or_(
-            Document.sha256 == hash,
-            Document.path == pathstr
-        )
-    ).first()
-    if not doc:
-        return Res(Document(), "new", hash)
-    if doc.sha256 == hash and doc.path == pathstr:
-        return Res(doc, "same", hash)
-    if doc.sha256 == hash and doc.path != pathstr:
-        p = Path(doc.path)
-        if p.is_file():
-            return Res(Document(), "duplicated", hash)
-        return Res(doc, "moved", hash)
-    return Res(doc, "modified", hash)
-
-
-def index_pdf(db_session: Session, path: str | Path, index_timestamp: float | None = None, commit=True) -> None:
-    path = Path(path)
-    res = analise_file(db_session, path)
-    if res.action not in ['new', 'duplicated', 'same']:
-        logging.info(f"{path} -> {res.action}")
-    doc = res.doc
-    if res.action == "modified":
-        delete_thumbnail(doc)
-        doc.sha256 = res.sha256
-        doc.content = extract_text_with_ocr(path)
-        if index_timestamp is not None:
-            doc.index_timestamp = index_timestamp
-        db_session.add(doc)
-        generate_pdf_thumbnail(doc)
-        if commit:
-            db_session.commit()
-    elif res.action == "moved":
-        doc.path = str(path)
-        doc.title = path.name
-        if index_timestamp is not None:
-            doc.index_timestamp = index_timestamp
-        db_session.add(doc)
-        generate_pdf_thumbnail(doc)
-        if commit:
-            db_session.commit()
-    elif res.action == "same":
-        if index_timestamp:
-            if index_timestamp is not None:
-                doc.index_timestamp = index_timestamp
-            db_session.add(doc)
-            generate_pdf_thumbnail(doc)
-            if commit:
-                db_session.commit()
-    elif res.action == "new" or res.action == "duplicated":
-        doc = Document()
+def needs_content(res: Res) -> bool:
+    return res.action in ("new", "duplicated", "modified") and res.copy_from is None
+
+
+def extract_content(loaded: LoadedFile, workers: int | None = None, ocr: bool = True,
+                    timer: FileTimer | None = None) -> tuple[list[str], int]:
+    # Returns the text of each page and the number of scanned pages left empty,
+    # with ocr=True only pages whose OCR timed out
+    cache = get_cache()
+    texts = cache.get_content(loaded.sha256)
+    if texts is not None:
+        return texts, 0
+    pages = extract_pages(loaded.pdf, workers=workers, cache=cache, ocr=ocr)
+    texts = [p.text for p in pages]
+    pending = sum(p.pending or p.timed_out for p in pages)
+    if timer is not None:
+        skipped, by_skipping, by_dpi = ocr_savings(pages)
+        # Skipped pages are counted when the document is indexed, the OCR pass finds them again
+        if not ocr:
+            timer.count("pages left out of OCR", skipped)
+            timer.count("OCR seconds saved (estimate)", by_skipping)
+        else:
+            timer.count("OCR seconds saved (estimate)", by_dpi)
+            timer.count("OCR page timeouts", sum(p.timed_out for p in pages))
+    # Only complete text goes in the cache
+    if not pending:
+        cache.put_content(loaded.sha256, texts)
+    return texts, pending
+
+
+class Reconciler:
+    # Classifies files against the document table and applies the changes with
+    # batched statements. With preload the id, path, hash and stat of every row
+    # are loaded once up front, otherwise rows are looked up as files come in.
+    # Timings and counts of what was done go to stats. With a run_id every file
+    # applied is written to that run's journal along with its changes.
+
+    def __init__(self, db_session: Session, index_timestamp: float | None = None, preload: bool = False,
+                 stats: RunStats | None = None, run_id: int | None = None) -> None:
+        self.db_session = db_session
+        self.stats = stats or RunStats()
+        self.run_id = run_id
+        self._journal: list[dict] = []
+        self._last_commit = time.monotonic()
+        # Characters of page text waiting to be written, close enough to bytes
+        self._pending_bytes = 0
+        self.index_timestamp = index_timestamp if index_timestamp is not None else datetime.now().timestamp()
+        self.preloaded = preload
+        self.by_path: dict[str, Entry] = {}
+        self.by_sha: dict[str, dict[str, Entry]] = defaultdict(dict)
+        self._inserts: list[tuple[dict, Entry]] = []
+        self._updates: list[dict] = []
+        self._pages: list[tuple[Entry, list[str]]] = []
+        self._copies: list[tuple[Entry, int]] = []
+        self._ocr_jobs: dict[str, int] = {}
+        # Hashes of files found moved, their OCR job may have given up on them
+        self._moved: set[str] = set()
+        # Something searchable changed since the last flush
+        self._changed = False
+        if preload:
+            self._load(None)
+
+    def _load(self, where) -> None:
+        stmt = select(Document.id, Document.path, Document.sha256, Document.size, Document.mtime_ns, Document.inode)
+        if where is not None:
+            # Pending changes must be in the database before reading it again
+            self.flush()
+            stmt = stmt.where(where)
+        for row in self.db_session.execute(stmt):
+            if row.path not in self.by_path:
+                self._remember(Entry(row.id, row.path, row.sha256, (row.size, row.mtime_ns, row.inode)))
+
+    def _remember(self, entry: Entry) -> None:
+        self.by_path[entry.path] = entry
+        self.by_sha[entry.sha256][entry.path] = entry
+
+    def _forget(self, entry: Entry) -> None:
+        self.by_path.pop(entry.path, None)
+        same_hash = self.by_sha.get(entry.sha256, {})
+        same_hash.pop(entry.path, None)
+        if not same_hash:
+            self.by_sha.pop(entry.sha256, None)
+
+    def lookup(self, path: Path) -> Entry | None:
+        pathstr = path.as_posix()
+        if not self.preloaded and pathstr not in self.by_path:
+            self._load(Document.path == pathstr)
+        return self.by_path.get(pathstr)
+
+    def with_hash(self, sha256: str) -> list[Entry]:
+        if not self.preloaded:
+            self._load(Document.sha256 == sha256)
+        return list(self.by_sha.get(sha256, {}).values())
+
+    def check_stat(self, path: Path, stat: FileStat) -> Res | None:
+        # Unchanged size, mtime and inode means unchanged content, no need to read the file
+        entry = self.lookup(path)
+        if entry and entry.stat == stat:
+            return Res("same", entry.sha256, stat, entry)
+        return None
+
+    def classify(self, path: Path, sha256: str, stat: FileStat) -> Res:
+        entry = self.lookup(path)
+        if entry:
+            return Res("same" if entry.sha256 == sha256 else "modified", sha256, stat, entry)
+        others = self.with_hash(sha256)
+        for other in others:
+            if not Path(other.path).is_file():
+                return Res("moved", sha256, stat, other)
+        if others:
+            self.flush()
+            return Res("duplicated", sha256, stat, None, others[0].id)
+        return Res("new", sha256, stat)
+
+    def apply(self, path: Path, res: Res, pages: list[str] | None = None, ocr_pages: int = 0) -> None:
+        if res.action not in ['new', 'duplicated', 'same']:
+            logging.info(f"{path} -> {res.action}")
+        self.stats.count(res.action)
+        if res.action != "same":
+            self._changed = True
+        pathstr = path.as_posix()
+        stat = dict(zip(("size", "mtime_ns", "inode"), res.stat))
+        entry = res.entry
+        if res.action == "same":
+            assert entry is not None
+            # Unchanged rows are not written, so the FTS index is left alone
+            if entry.stat != res.stat:
+                entry.stat = res.stat
+                self._update(entry, **stat)
+        elif res.action == "moved":
+            assert entry is not None
+            self._forget(entry)
+            entry.path, entry.stat = pathstr, res.stat
+            self._remember(entry)
+            self._moved.add(entry.sha256)
+            self._update(entry, path=pathstr, title=path.name, index_timestamp=self.index_timestamp, **stat)
+        elif res.action == "modified":
+            assert entry is not None
+            # The old thumbnail may still belong to a copy of the previous version
+            if not [e for e in self.with_hash(entry.sha256) if e is not entry]:
+                delete_thumbnail(Document(sha256=entry.sha256))
+            self._forget(entry)
+            entry.sha256, entry.stat = res.sha256, res.stat
+            self._remember(entry)
+            # Also clears text stored on the row by older versions
+            self._update(entry, sha256=res.sha256, content="", index_timestamp=self.index_timestamp, **stat)
+            self._pages.append((entry, pages or []))
+        else:
+            entry = Entry(None, pathstr, res.sha256, res.stat)
+            self._remember(entry)
+            values = dict(title=path.name, description="", content="", sha256=res.sha256,
+                          path=pathstr, index_timestamp=self.index_timestamp, **stat)
+            self._inserts.append((values, entry))
+            if res.copy_from is not None and pages is None:
+                self._copies.append((entry, res.copy_from))
+            else:
+                self._pages.append((entry, pages or []))
+        if ocr_pages:
+            self._ocr_jobs[res.sha256] = ocr_pages
+        if pages:
+            self._pending_bytes += sum(len(text) for text in pages)
+        if self.run_id is not None:
+            self._journal.append(dict(run_id=self.run_id, path=pathstr))
         try:
-            doc.content = extract_text_with_ocr(path)
+            with self.stats.stage("thumbnail"):
+                generate_pdf_thumbnail(Document(path=pathstr, sha256=res.sha256))
         except Exception as e:
-            print(f"Error extracting text from {path}:")
-            print(e)
+            logging.error(f"Error generating thumbnail for {path}: {e}")
+
+    def _update(self, entry: Entry, **values) -> None:
+        if entry.id is None:
+            self.flush()
+        self._updates.append(dict(id=entry.id, **values))
+
+    def remove(self, path: Path) -> None:
+        entry = self.lookup(path)
+        if entry is None:
             return
-        doc.title = path.name
-        doc.path = path.as_posix()
-        doc.sha256 = res.sha256
-        if index_timestamp is not None:
-            doc.index_timestamp = index_timestamp
-        db_session.add(doc)
-        if commit:
-            db_session.commit()
-        generate_pdf_thumbnail(doc)
+        # A row queued for insert needs its id
+        self.flush()
+        if not [e for e in self.with_hash(entry.sha256) if e is not entry]:
+            delete_thumbnail(Document(sha256=entry.sha256))
+        self._forget(entry)
+        self.db_session.execute(delete(Document).where(Document.id == entry.id))
+        self.stats.count("deleted")
+        self._changed = True
+
+    def delete_missing(self, seen: set[str]) -> int:
+        # Only ids and paths are read, the text of the documents is never touched
+        if not self.preloaded:
+            self._load(None)
+            self.preloaded = True
+        self.flush()
+        missing = [e for path, e in self.by_path.items() if path not in seen]
+        ids = [e.id for e in missing]
+        for i in range(0, len(ids), 500):
+            self.db_session.execute(delete(Document).where(Document.id.in_(ids[i:i + 500])))
+        for entry in missing:
+            self._forget(entry)
+        # Everything is preloaded, so by_sha holds every remaining copy
+        for sha256 in {e.sha256 for e in missing}:
+            if not self.with_hash(sha256):
+                delete_thumbnail(Document(sha256=sha256))
+        self.stats.count("deleted", len(missing))
+        if missing:
+            self._changed = True
+        return len(missing)
+
+    def flush(self) -> None:
+        if self._inserts:
+            rows = [values for values, _ in self._inserts]
+            # Another writer, such as the GUI's watcher, may have indexed the same
+            # path since it was looked up. Its row is taken over rather than
+            # failing the whole batch on the unique path.
+            stmt = sqlite.insert(Document)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Document.path],
+                set_={name: stmt.excluded[name] for name in rows[0] if name != "path"},
+            )
+            inserted = self.db_session.execute(stmt.returning(Document.path, Document.id), rows)
+            ids = dict(inserted.tuples().all())
+            for _, entry in self._inserts:
+                entry.id = ids[entry.path]
+            self._inserts = []
+        if self._updates:
+            self.db_session.execute(update(Document), self._updates)
+            self._updates = []
+        # Every entry has its id once the inserts above are done
+        for entry, texts in self._pages:
+            assert entry.id is not None
+            Page.store(self.db_session, entry.id, texts)
+        self._pages = []
+        for entry, from_id in self._copies:
+            assert entry.id is not None
+            Page.copy(self.db_session, entry.id, from_id)
+        self._copies = []
+        if self._ocr_jobs:
+            # Smaller jobs first, they make the most documents searchable soonest
+            now = datetime.now().timestamp()
+            rows = [dict(sha256=sha256, pages=pages, priority=pages, created=now, attempts=0)
+                    for sha256, pages in self._ocr_jobs.items()]
+            stmt = sqlite.insert(OcrJob).on_conflict_do_nothing(index_elements=[OcrJob.sha256])
+            self.db_session.execute(stmt, rows)
+            self._ocr_jobs = {}
+        if self._moved:
+            self.db_session.execute(
+                update(OcrJob)
+                .where(OcrJob.sha256.in_(self._moved), OcrJob.error == FILE_MISSING)
+                .values(attempts=0, error=None)
+            )
+            self._moved = set()
+        if self._journal:
+            stmt = sqlite.insert(IndexRunFile).on_conflict_do_nothing()
+            self.db_session.execute(stmt, self._journal)
+            self._journal = []
+        if self._changed:
+            # Cached search results older than this are dropped
+            Meta.bump_generation(self.db_session)
+            self._changed = False
+
+    def commit(self) -> None:
+        with self.stats.stage("commit"):
+            self.flush()
+            self.db_session.commit()
+        self._last_commit = time.monotonic()
+        self._pending_bytes = 0
+
+    def maybe_commit(self) -> None:
+        # Time bounds the work lost to an interruption, size bounds the memory held
+        if time.monotonic() - self._last_commit >= config.COMMIT_SECONDS or self._pending_bytes >= config.COMMIT_BYTES:
+            self.commit()
+
+
+def index_file(reconciler: Reconciler, path: Path, verify: bool = False, stat: FileStat | None = None) -> None:
+    # Only the text layer is extracted here, scanned pages go to the OCR queue.
+    # stat is the one the walk already took, if any.
+    if stat is None:
+        stat = FileStat.of(path)
+    res = None if verify else reconciler.check_stat(path, stat)
+    if res:
+        reconciler.apply(path, res)
+        return
+    timer = FileTimer()
+    with timer.stage("hash"):
+        loaded = LoadedFile(path)
+    with loaded:
+        res = reconciler.classify(path, loaded.sha256, stat)
+        pages, ocr_pages = None, 0
+        if needs_content(res):
+            try:
+                with timer.stage("extract"):
+                    pages, ocr_pages = extract_content(loaded, ocr=False, timer=timer)
+                with timer.stage("thumbnail"):
+                    generate_pdf_thumbnail(Document(path=path.as_posix(), sha256=res.sha256), pdf=loaded.pdf)
+            except Exception as e:
+                print(f"Error extracting text from {path}:")
+                print(e)
+                reconciler.stats.count("failed")
+                return
+    reconciler.stats.add_file(path, timer, ocr_pages)
+    reconciler.apply(path, res, pages, ocr_pages)
+
+
+def index_pdf(db_session: Session, path: str | Path, index_timestamp: float | None = None, commit=True,
+              verify: bool = False) -> None:
+    reconciler = Reconciler(db_session, index_timestamp)
+    index_file(reconciler, Path(path), verify)
+    if commit:
+        reconciler.commit()
+    else:
+        reconciler.flush()
 
 
 def on_delete_file(db_session: Session, path: Path) -> None:
-    
-    doc = db_session.query(Document).where(Document.path == path.as_posix()).first()
-    if doc:
-        delete_thumbnail(doc)  
-        db_session.delete(doc)  
-        db_session.commit()
+    reconciler = Reconciler(db_session)
+    reconciler.remove(path)
+    reconciler.commit()
 
 
-def update_index() -> None:
+def discover(stats: RunStats, seen: set[str], errors: list[OSError], walk_workers: int = 1,
+             done: set[str] | None = None) -> Iterator[tuple[Path, FileStat]]:
+    # Files are handed on as the walk finds them, indexing starts right away,
+    # with the stat from the directory listing so they aren't stat'ed again.
+    # Files done by the run being resumed are only marked as seen.
+    walker = walk_pdfs(Path("."), errors.append, workers=walk_workers)
+    while True:
+        with stats.stage("walk"):
+            found = next(walker, None)
+        if found is None:
+            return
+        seen.add(found[0])
+        if done and found[0] in done:
+            stats.count("done before resume")
+            continue
+        yield Path(found[0]), FileStat.from_stat(found[1])
+
+
+def update_index(verify: bool = False, jobs: int = 1, walk_workers: int = config.WALK_WORKERS,
+                 resume: bool = False) -> RunStats:
+    from tqdm import tqdm
+
+    stats = RunStats("update-index", jobs)
+    seen: set[str] = set()
+    walk_errors: list[OSError] = []
     with DBSession() as db_session:
-        t = datetime.now().timestamp()
-        pdf_files = list(Path(".").rglob("*.pdf"))
-        for i, pdf_file in enumerate(tqdm(pdf_files, desc="Indexing PDFs")):
-            index_pdf(db_session, pdf_file, t, commit=False)
-            if i % 10 == 0:
-                db_session.commit()
-        db_session.commit()
-        db_session.execute(delete(Document).where(Document.index_timestamp != t))
-        db_session.commit()
-
-
-def gen_thumbs() -> None:
+        run = IndexRun.unfinished(db_session) if resume else None
+        if run is not None:
+            done = run.done_paths(db_session)
+            # A resumed run goes on the way it started
+            verify = run.verify
+            started = datetime.fromtimestamp(run.started).isoformat(timespec="seconds")
+            print(f"Resuming the run started {started}, {len(done)} file(s) already done")
+        else:
+            if resume:
+                print("No interrupted run to resume, starting a new one")
+            run = IndexRun.start(db_session, verify)
+            done = set()
+        reconciler = Reconciler(db_session, preload=True, stats=stats, run_id=run.id)
+        pdf_files = discover(stats, seen, walk_errors, walk_workers, done)
+        if jobs > 1:
+            from pipeline import Pipeline
+            pipeline = Pipeline(reconciler, jobs, verify)
+            with tqdm(desc="Indexing PDFs", unit=" files") as progress:
+                pipeline.run(pdf_files, on_progress=progress.update)
+            pipeline.report()
+        else:
+            for pdf_file, stat in tqdm(pdf_files, desc="Indexing PDFs", unit=" files"):
+                try:
+                    index_file(reconciler, pdf_file, verify, stat)
+                except OSError as e:
+                    print(f"Error indexing {pdf_file}: {e}")
+                    stats.count("failed")
+                reconciler.maybe_commit()
+        reconciler.commit()
+        if walk_errors:
+            # Files in folders that couldn't be listed may still exist
+            print(f"Not removing deleted files, {len(walk_errors)} error(s) while listing folders, "
+                  f"the first one: {walk_errors[0]}")
+        else:
+            # Files that failed to index are still on disk and keep their previous row
+            with stats.stage("delete"):
+                reconciler.delete_missing(seen)
+        run.finish(db_session)
+        reconciler.commit()
+        queued = db_session.scalar(select(func.count()).select_from(OcrJob))
+    stats.save()
+    print(f"Indexed {len(seen)} file(s) in {stats.seconds:.1f}s, see stats for a breakdown")
+    if queued:
+        print(f"{queued} document(s) have pages waiting for OCR, see ocr-status")
+    return stats
+
+
+def existing_thumbs() -> set[str]:
+    # Lists the shards instead of checking every document's thumbnail
+    found: set[str] = set()
+    try:
+        entries = list(os.scandir(config.THUMBSDIR))
+    except FileNotFoundError:
+        return found
+    for entry in entries:
+        if entry.is_dir():
+            with os.scandir(entry.path) as shard:
+                found.update(e.name[:-4] for e in shard if e.name.endswith(".jpg"))
+        elif entry.name.endswith(".png"):
+            # Flat layout from before sharding
+            os.remove(entry.path)
+    return found
+
+
+def _make_thumb(sha256: str, path: str) -> str | None:
+    try:
+        generate_pdf_thumbnail(Document(path=path, sha256=sha256))
+    except Exception as e:
+        return f"Error generating thumbnail for {path}: {e}"
+    return None
+
+
+def gen_thumbs(jobs: int | None = None) -> None:
+    from tqdm import tqdm
+
+    existing = existing_thumbs()
     with DBSession() as db_session:
-        docs = db_session.query(Document).all()
-        for doc in docs:
-            generate_pdf_thumbnail(doc)
+        # Copies of a file share one thumbnail
+        rows = db_session.execute(select(Document.sha256, func.min(Document.path)).group_by(Document.sha256)).all()
+    missing = [(sha256, path) for sha256, path in rows if sha256 not in existing]
+    if not missing:
+        return
+    # Created here so the workers don't race to create the cache tables
+    get_cache()
+    with ProcessPoolExecutor(jobs or os.cpu_count()) as executor:
+        errors = executor.map(_make_thumb, *zip(*missing), chunksize=16)
+        for error in tqdm(errors, total=len(missing), desc="Generating thumbnails"):
+            if error:
+                print(error)
@@ -1,14 +1,16 @@
+import json
 import logging
 from pathlib import Path
 import click
 import config
-from gui.gui import run_gui
-from indexer import update_index
-from models import init_db
-from watch import watch_folder
+import run_stats
 import os
 import stat
 
+# Each command imports what it needs when it runs: Qt, PyMuPDF and watchdog
+# take far longer to load than most commands take to run.
+
+(config.APPDIR / ".local").mkdir(exist_ok=True)
 logging.basicConfig(
     filename=str(config.APPDIR / ".local/indexer.log"),
     level=logging.DEBUG,
@@ -17,14 +19,22 @@ logging.basicConfig(
 
 
 @click.group()
-def cli():
+@click.option("--profile", is_flag=True, help="Run the command under cProfile, the profile is saved in indexdir/runs")
+@click.pass_context
+def cli(ctx, profile):
     """Indexer."""
-    pass
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        ctx.call_on_close(lambda: run_stats.save_profile(profiler))
 
 
 @cli.command()
 @click.option("-w", required=False, help="Workpath")
 def gui(w):
+    from gui.gui import run_gui
+
     if w:
         os.chdir(w)
     run_gui()
@@ -49,18 +59,113 @@ def install():
 
 
 @cli.command("update-index")
-def update_index_():
-    update_index()
+@click.option("--verify", is_flag=True, help="Rehash every file instead of trusting size/mtime/inode")
+@click.option("--jobs", "-j", default=1, show_default=True, help="Worker processes for hashing, extraction and thumbnails")
+@click.option("--walk-workers", default=config.WALK_WORKERS, show_default=True,
+              help="Threads listing folders, raise it on network filesystems")
+@click.option("--resume", is_flag=True, help="Continue an interrupted run instead of starting over")
+def update_index_(verify, jobs, walk_workers, resume):
+    from indexer import update_index
+
+    try:
+        update_index(verify=verify, jobs=jobs, walk_workers=walk_workers, resume=resume)
+    except KeyboardInterrupt:
+        raise click.ClickException("Interrupted, run update-index --resume to continue")
+
+
+@cli.command("gen-thumbs")
+@click.option("--jobs", "-j", type=int, help="Worker processes, defaults to the number of cores")
+def gen_thumbs_(jobs):
+    from indexer import gen_thumbs
+
+    gen_thumbs(jobs)
+
+
+@cli.command("ocr-status")
+def ocr_status():
+    from database import DBSession
+    import ocr_queue
+
+    with DBSession() as db_session:
+        status = ocr_queue.ocr_status(db_session)
+    print(f"{status.jobs} document(s) waiting for OCR, {status.pages} page(s)")
+    for path, pages in status.upcoming:
+        print(f"  {pages:5} page(s)  {path}")
+    if status.failed:
+        print(f"{len(status.failed)} document(s) failed {ocr_queue.MAX_ATTEMPTS} times:")
+        for path, error in status.failed:
+            print(f"  {path}: {error}")
+
+
+@cli.command()
+def ocr():
+    from tqdm import tqdm
+    from database import DBSession
+    import ocr_queue
+
+    with DBSession() as db_session:
+        total = ocr_queue.ocr_status(db_session, upcoming=0).jobs
+    stats = run_stats.RunStats("ocr")
+    with tqdm(total=total, desc="OCR") as progress:
+        ocr_queue.drain(progress.update, stats=stats)
+    stats.save()
+    print(f"OCRed {stats.ocr_pages} page(s) in {stats.seconds:.1f}s, see stats for a breakdown")
+
+
+@cli.command()
+@click.option("--runs", "-n", default=1, show_default=True, help="Number of recent runs to show")
+@click.option("--json", "as_json", is_flag=True, help="Print the runs as JSON")
+def stats(runs, as_json):
+    import client
+
+    recent = run_stats.load_runs(runs)
+    # Only a running serve has a search cache worth reporting
+    cache = client.request({"op": "stats"})
+    if as_json:
+        print(json.dumps({"runs": [run.to_dict() for run in recent], "search_cache": cache}, indent=2))
+        return
+    if not recent:
+        print("No runs recorded yet")
+    for run in recent:
+        print(run_stats.format_run(run))
+    if cache:
+        print(f"Search cache of serve: {cache['searches']} search(es), {cache['hit_ratio']:.0%} hits, "
+              f"{cache['entries']} cached page(s)")
 
 
 @cli.command("init")
 def init():
+    from models import init_db
+
     init_db()
 
 
 @cli.command()
-def watch():
-    watch_folder()
+def serve():
+    from server import serve
+
+    try:
+        serve()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command()
+@click.argument("query", nargs=-1, required=True)
+@click.option("--limit", "-n", type=click.IntRange(min=1), help="Results per page, 30 by default")
+@click.option("--cursor", help="Cursor of the previous page, as printed in its JSON")
+def search(query, limit, cursor):
+    import client
+
+    print(json.dumps(client.search(" ".join(query), limit, json.loads(cursor) if cursor else None)))
+
+
+@cli.command()
+@click.option("--jobs", "-j", default=1, show_default=True, help="Worker processes for indexing batches of changes")
+def watch(jobs):
+    from watch import watch_folder
+
+    watch_folder(jobs)
 
 
 if __name__ == "__main__":
@@ -1,67 +1,358 @@
+from dataclasses import dataclass
+from datetime import datetime
+import json
 from pathlib import Path
 import config
-from database import Base, make_engine
+from database import Base, get_engine
 from sqlalchemy.orm import mapped_column, Mapped, Session
 import sqlalchemy as sa
 
 
+# Markers around the matched terms in SearchResult.snippet
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+def thumb_path(sha256: str) -> Path:
+    # Sharded by the first two hex digits to keep directories small
+    return config.THUMBSDIR / sha256[:2] / f"{sha256}.jpg"
+
+
+@dataclass
+class SearchResult:
+    id: int
+    title: str
+    path: str
+    sha256: str
+    loc: str | None
+    rank: float
+    snippet: str
+    # Best matching page, None when the match is in the title or description
+    # or in text indexed before pages were stored
+    page: int | None = None
+    # Number of pages holding every term
+    page_hits: int = 0
+
+    @property
+    def thumb(self) -> Path:
+        return thumb_path(self.sha256)
+
+    @property
+    def cursor(self) -> tuple[float, int]:
+        return (self.rank, self.id)
+
+
+@dataclass(slots=True)
+class SearchMatch:
+    # A matching document as ranked, before its row and snippet are read
+    id: int
+    rank: float
+    # Page to show, None when the best hit is in the title or description
+    page_id: int | None
+    # Pages holding every term
+    page_hits: int
+
+    @property
+    def cursor(self) -> tuple[float, int]:
+        return (self.rank, self.id)
+
+
+def search_terms(query: str) -> list[str]:
+    # Each term is quoted as an FTS5 string, so hyphens, quotes and words like
+    # OR or NOT are searched for instead of read as query syntax. Add * after
+    # each term for prefix search. Terms without a letter or digit hold no
+    # token and would match nothing, they are left out.
+    return ['"{}"*'.format(t.replace('"', '""')) for t in query.split() if any(c.isalnum() for c in t)]
+
+
+@dataclass
+class SearchPage:
+    results: list[SearchResult]
+    # Pass back to search to get the following page, None on the last page
+    cursor: tuple[float, int] | None
+
+
 class Document(Base):
     __tablename__ = 'document'
     id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
     title: Mapped[str] = mapped_column(sa.Text)
     description: Mapped[str] = mapped_column(sa.Text, default="")
-    content: Mapped[str] = mapped_column(sa.Text)
-    sha256: Mapped[str] = mapped_column(sa.Text)
-    path: Mapped[str] = mapped_column(sa.Text)
+    # Empty, the text is kept per page in the page table
+    content: Mapped[str] = mapped_column(sa.Text, default="")
+    sha256: Mapped[str] = mapped_column(sa.Text, index=True)
+    path: Mapped[str] = mapped_column(sa.Text, index=True, unique=True)
     loc: Mapped[str | None] = mapped_column(sa.Text)
     index_timestamp: Mapped[float] = mapped_column(sa.Float)
+    size: Mapped[int | None] = mapped_column(sa.Integer)
+    mtime_ns: Mapped[int | None] = mapped_column(sa.Integer)
+    inode: Mapped[int | None] = mapped_column(sa.Integer)
 
     @property
     def thumb(self) -> Path:
-        return config.THUMBSDIR / f"{self.sha256}.png"
+        return thumb_path(self.sha256)
+
+    @classmethod
+    def rank(cls, session: Session, query: str, limit: int | None = None,
+             after: tuple[float, int] | None = None) -> list[SearchMatch]:
+        # A document matches when each term is on one of its pages or in its
+        # title or description, not necessarily all in the same place, as when
+        # the text was indexed whole. It is ranked by the sum of the best bm25
+        # of each term. The page shown is its best page holding every term, or
+        # else its best hit for any term.
+        # Result pages are keyed on (rank, id) instead of OFFSET, so later pages
+        # don't build and throw away the rows of the earlier ones.
+        # With a single min() in a query SQLite takes the bare columns from the
+        # row holding the minimum, which is how the best page is picked.
+        terms = search_terms(query)
+        if not terms:
+            return []
+        term_hits = "\n                UNION ALL\n".join(
+            f"""SELECT {i} AS term, p.document_id AS id, min(page_fts.rank) AS rank, p.id AS page_id, count(*) AS pages
+                FROM page_fts
+                JOIN page p ON p.id = page_fts.rowid
+                WHERE page_fts MATCH :term{i}
+                GROUP BY p.document_id
+                UNION ALL
+                SELECT {i}, rowid, rank, NULL, 0 FROM document_fts WHERE document_fts MATCH :term{i}"""
+            for i in range(len(terms))
+        )
+        if len(terms) == 1:
+            # The pages holding the term are the pages holding every term
+            full_pages = "SELECT id, page_id, pages FROM term_hits WHERE page_id IS NOT NULL"
+        else:
+            full_pages = """SELECT p.document_id AS id, min(page_fts.rank), p.id AS page_id, count(*) AS pages
+                FROM page_fts
+                JOIN page p ON p.id = page_fts.rowid
+                WHERE page_fts MATCH :all
+                GROUP BY p.document_id"""
+        sql = sa.text(f"""
+            WITH term_hits AS MATERIALIZED (
+                {term_hits}
+            ),
+            matched AS (
+                SELECT id, sum(rank) AS rank, min(rank), page_id
+                FROM (SELECT term, id, min(rank) AS rank, page_id FROM term_hits GROUP BY term, id)
+                GROUP BY id
+                HAVING count(*) = :terms
+            ),
+            top AS MATERIALIZED (
+                SELECT id, rank, page_id
+                FROM matched
+                WHERE :after_rank IS NULL OR (rank, id) > (:after_rank, :after_id)
+                ORDER BY rank, id
+                LIMIT :limit
+            ),
+            full_pages AS (
+                {full_pages}
+            )
+            -- Grouped rather than joined, SQLite doesn't index full_pages for a join
+            SELECT id, max(rank) AS rank, coalesce(max(full_page_id), max(page_id)) AS page_id,
+                   max(pages) AS page_hits
+            FROM (
+                SELECT id, rank, page_id, NULL AS full_page_id, 0 AS pages FROM top
+                UNION ALL
+                SELECT id, NULL, NULL, page_id, pages FROM full_pages WHERE id IN (SELECT id FROM top)
+            )
+            GROUP BY id
+            ORDER BY rank, id
+        """)
+        after_rank, after_id = after if after is not None else (None, None)
+        params = {
+            **{f"term{i}": term for i, term in enumerate(terms)},
+            "all": " ".join(terms),
+            "terms": len(terms),
+            "limit": -1 if limit is None else limit,
+            "after_rank": after_rank,
+            "after_id": after_id,
+        }
+        return [SearchMatch(*row) for row in session.execute(sql, params)]
 
     @classmethod
-    def search(cls, session: Session, query: str, limit: int | None = None):
-        # Add * after each term for prefix search
-        terms = query.strip().split()
-        query_with_wildcards = " ".join(f"{t}*" for t in terms)
-
-        sql_text = """
-            SELECT d.id, d.title, d.content, d.description, d.sha256, d.path, d.index_timestamp, d.loc,
-                   bm25(document_fts) AS rank
-            FROM document_fts f
-            JOIN document d ON d.id = f.rowid
-            WHERE document_fts MATCH :query
-            ORDER BY rank
-        """
-
-        if limit is not None:
-            sql_text += " LIMIT :limit"
-
-        sql = sa.text(sql_text)
-        params = {"query": f"{query}*"}
-        if limit is not None:
-            params["limit"] = str(limit)
-
-        result = session.execute(sql, params)
+    def results(cls, session: Session, query: str, matches: list[SearchMatch]) -> list[SearchResult]:
+        # Reads the rows and builds the snippets of ranked matches only.
+        # CROSS JOIN keeps top as the outer loop so each snippet is a rowid lookup.
+        if not matches:
+            return []
+        sql = sa.text("""
+            WITH top AS MATERIALIZED (
+                SELECT key AS ord, json_extract(value, '$[0]') AS id, json_extract(value, '$[1]') AS page_id
+                FROM json_each(:top)
+            ),
+            snippets AS MATERIALIZED (
+                SELECT top.id, snippet(page_fts, 0, :start, :end, '…', 16) AS snippet
+                FROM top
+                CROSS JOIN page_fts
+                WHERE page_fts MATCH :any AND page_fts.rowid = top.page_id
+                UNION ALL
+                SELECT top.id, snippet(document_fts, -1, :start, :end, '…', 16)
+                FROM top
+                CROSS JOIN document_fts
+                WHERE document_fts MATCH :any AND document_fts.rowid = top.id AND top.page_id IS NULL
+            )
+            SELECT d.id, d.title, d.path, d.sha256, d.loc, p.number, s.snippet
+            FROM top
+            CROSS JOIN document d
+            LEFT JOIN page p ON p.id = top.page_id
+            LEFT JOIN snippets s ON s.id = top.id
+            WHERE d.id = top.id
+            ORDER BY top.ord
+        """)
+        params = {
+            "top": json.dumps([[m.id, m.page_id] for m in matches]),
+            # Highlights every term present, on pages that only hold some of them too
+            "any": " OR ".join(search_terms(query)),
+            "start": MATCH_START,
+            "end": MATCH_END,
+        }
+        rows = {row.id: row for row in session.execute(sql, params)}
         return [
-            cls(
-                id=row.id,
+            SearchResult(
+                id=m.id,
                 title=row.title,
-                content=row.content,
-                description=row.description,
-                sha256=row.sha256,
                 path=row.path,
-                index_timestamp=row.index_timestamp,
-                loc=row.loc
+                sha256=row.sha256,
+                loc=row.loc,
+                rank=m.rank,
+                snippet=row.snippet or "",
+                page=row.number,
+                page_hits=m.page_hits
             )
-            for row in result
+            for m in matches
+            # Deleted since it was ranked
+            if (row := rows.get(m.id)) is not None
         ]
 
+    @classmethod
+    def search(cls, session: Session, query: str, limit: int | None = None,
+               after: tuple[float, int] | None = None) -> list[SearchResult]:
+        return cls.results(session, query, cls.rank(session, query, limit, after))
+
+    @classmethod
+    def search_page(cls, session: Session, query: str, page_size: int,
+                    cursor: tuple[float, int] | None = None) -> SearchPage:
+        results = cls.search(session, query, page_size, cursor)
+        next_cursor = results[-1].cursor if len(results) == page_size else None
+        return SearchPage(results, next_cursor)
+
+    @classmethod
+    def get_description(cls, session: Session, id: int) -> str:
+        return session.scalar(sa.select(cls.description).where(cls.id == id)) or ""
+
+
+class Page(Base):
+    __tablename__ = 'page'
+    __table_args__ = (sa.Index("ix_page_document_number", "document_id", "number"),)
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    document_id: Mapped[int] = mapped_column(sa.Integer)
+    # None for text indexed before pages were stored apart, which is the whole document
+    number: Mapped[int | None] = mapped_column(sa.Integer)
+    text: Mapped[str] = mapped_column(sa.Text)
+
+    @classmethod
+    def numbers(cls, session: Session, document_id: int) -> list[int | None]:
+        return list(session.scalars(
+            sa.select(cls.number).where(cls.document_id == document_id).order_by(cls.number)
+        ))
+
+    @classmethod
+    def get_text(cls, session: Session, document_id: int, number: int | None) -> str:
+        return session.scalar(
+            sa.select(cls.text).where(cls.document_id == document_id, cls.number.is_not_distinct_from(number))
+        ) or ""
+
+    @classmethod
+    def store(cls, session: Session, document_id: int, texts: list[str]) -> None:
+        # Replaces the pages of a document, texts[0] is page 1
+        session.execute(sa.delete(cls).where(cls.document_id == document_id))
+        if texts:
+            session.execute(sa.insert(cls), [
+                dict(document_id=document_id, number=number, text=text)
+                for number, text in enumerate(texts, start=1)
+            ])
+
+    @classmethod
+    def copy(cls, session: Session, document_id: int, from_document_id: int) -> None:
+        session.execute(sa.delete(cls).where(cls.document_id == document_id))
+        session.execute(sa.insert(cls).from_select(
+            ["document_id", "number", "text"],
+            sa.select(sa.literal(document_id), cls.number, cls.text).where(cls.document_id == from_document_id)
+        ))
+
+
+class OcrJob(Base):
+    # Documents indexed with only their text layer, waiting for their scanned
+    # pages to be OCR'd. Keyed by hash, copies of a file share one job.
+    __tablename__ = 'ocr_job'
+    sha256: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+    pages: Mapped[int] = mapped_column(sa.Integer)
+    # Lower runs first
+    priority: Mapped[int] = mapped_column(sa.Integer, index=True)
+    created: Mapped[float] = mapped_column(sa.Float)
+    attempts: Mapped[int] = mapped_column(sa.Integer, default=0)
+    error: Mapped[str | None] = mapped_column(sa.Text)
+
+
+class Meta(Base):
+    # Named counters of the index
+    __tablename__ = 'meta'
+    key: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+    value: Mapped[int] = mapped_column(sa.Integer, default=0)
+
+    @classmethod
+    def generation(cls, session: Session) -> int:
+        # Moves on with every change that can alter search results
+        return session.scalar(sa.select(cls.value).where(cls.key == "generation")) or 0
+
+    @classmethod
+    def bump_generation(cls, session: Session) -> None:
+        # Runs in the caller's transaction, readers see the new generation together with the changes
+        session.execute(sa.text(
+            "INSERT INTO meta(key, value) VALUES ('generation', 1) "
+            "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+        ))
+
+
+class IndexRun(Base):
+    # Journal of the latest update-index run. Files are recorded as done in the
+    # same transaction as their changes, so an interrupted run can be resumed
+    # without reading them again.
+    __tablename__ = 'index_run'
+    id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    started: Mapped[float] = mapped_column(sa.Float)
+    verify: Mapped[bool] = mapped_column(sa.Boolean, default=False)
+    finished: Mapped[float | None] = mapped_column(sa.Float)
+
+    @classmethod
+    def unfinished(cls, session: Session) -> "IndexRun | None":
+        return session.scalars(sa.select(cls).where(cls.finished.is_(None)).order_by(cls.id.desc())).first()
+
+    @classmethod
+    def start(cls, session: Session, verify: bool) -> "IndexRun":
+        # Only the latest run is kept
+        session.execute(sa.delete(IndexRunFile))
+        session.execute(sa.delete(cls))
+        run = cls(started=datetime.now().timestamp(), verify=verify)
+        session.add(run)
+        session.commit()
+        return run
+
+    def done_paths(self, session: Session) -> set[str]:
+        return set(session.scalars(sa.select(IndexRunFile.path).where(IndexRunFile.run_id == self.id)))
+
+    def finish(self, session: Session) -> None:
+        session.execute(sa.delete(IndexRunFile).where(IndexRunFile.run_id == self.id))
+        self.finished = datetime.now().timestamp()
+
+
+class IndexRunFile(Base):
+    __tablename__ = 'index_run_file'
+    run_id: Mapped[int] = mapped_column(sa.Integer, primary_key=True)
+    path: Mapped[str] = mapped_column(sa.Text, primary_key=True)
+
 
 def create_fts():
-    engine = make_engine()
-    with engine.connect() as conn:
+    engine = get_engine()
+    with engine.begin() as conn:
         conn.execute(sa.text("""
             CREATE VIRTUAL TABLE IF NOT EXISTS document_fts
             USING fts5(
@@ -73,11 +364,20 @@ def create_fts():
                 prefix='2 3'
             );
         """))
+        conn.execute(sa.text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS page_fts
+            USING fts5(
+                text,
+                content='page',
+                content_rowid='id',
+                prefix='2 3'
+            );
+        """))
 
 
 def create_triggers():
-    engine = make_engine()
-    with engine.connect() as conn:
+    engine = get_engine()
+    with engine.begin() as conn:
         conn.execute(sa.text("""
             CREATE TRIGGER IF NOT EXISTS document_ai AFTER INSERT ON document
             BEGIN
@@ -94,8 +394,16 @@ def create_triggers():
             END;
         """))
 
+        # Only changes to the indexed columns need to touch document_fts.
+        # Replace the trigger of older indexes that fired on any update.
+        au_sql = conn.execute(sa.text(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'document_au'"
+        )).scalar()
+        if au_sql and "UPDATE OF" not in au_sql:
+            conn.execute(sa.text("DROP TRIGGER document_au"))
+
         conn.execute(sa.text("""
-            CREATE TRIGGER IF NOT EXISTS document_au AFTER UPDATE ON document
+            CREATE TRIGGER IF NOT EXISTS document_au AFTER UPDATE OF title, content, description ON document
             BEGIN
               INSERT INTO document_fts(document_fts, rowid, title, content, description)
               VALUES('delete', old.id, old.title, old.content, old.description);
@@ -104,13 +412,75 @@ def create_triggers():
             END;
         """))
 
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS document_pages_ad AFTER DELETE ON document
+            BEGIN
+              DELETE FROM page WHERE document_id = old.id;
+            END;
+        """))
+
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS page_ai AFTER INSERT ON page
+            BEGIN
+              INSERT INTO page_fts(rowid, text) VALUES (new.id, new.text);
+            END;
+        """))
+
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS page_ad AFTER DELETE ON page
+            BEGIN
+              INSERT INTO page_fts(page_fts, rowid, text) VALUES('delete', old.id, old.text);
+            END;
+        """))
+
+        conn.execute(sa.text("""
+            CREATE TRIGGER IF NOT EXISTS page_au AFTER UPDATE OF text ON page
+            BEGIN
+              INSERT INTO page_fts(page_fts, rowid, text) VALUES('delete', old.id, old.text);
+              INSERT INTO page_fts(rowid, text) VALUES (new.id, new.text);
+            END;
+        """))
+
+
+def move_content_to_pages() -> None:
+    # Text of older indexes can't be split into its pages again, it is kept as a
+    # single page without a number. Runs after the triggers exist so both FTS
+    # indexes follow.
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(sa.text("""
+            INSERT INTO page(document_id, number, text)
+            SELECT id, NULL, content FROM document WHERE content != ''
+        """))
+        conn.execute(sa.text("UPDATE document SET content = '' WHERE content != ''"))
+
+
+def upgrade_db() -> None:
+    # Add columns introduced after the index was created
+    engine = get_engine()
+    with engine.begin() as conn:
+        existing = {row.name for row in conn.execute(sa.text("PRAGMA table_info(document)"))}
+        for column in Document.__table__.columns:
+            if column.name not in existing:
+                coltype = column.type.compile(engine.dialect)
+                conn.execute(sa.text(f"ALTER TABLE document ADD COLUMN {column.name} {coltype}"))
+
+        # Older indexes could hold several rows for the same path, keep the first one
+        conn.execute(sa.text("DELETE FROM document WHERE id NOT IN (SELECT min(id) FROM document GROUP BY path)"))
+        for index in Base.metadata.tables[Document.__tablename__].indexes:
+            index.create(conn, checkfirst=True)
+        # Page rows whose document is gone
+        conn.execute(sa.text("DELETE FROM page WHERE document_id NOT IN (SELECT id FROM document)"))
+
 
 def init_db() -> None:
     try:
         config.INDEXDIR.mkdir()
     except FileExistsError:
         pass
-    eg = make_engine()
+    eg = get_engine()
     Base.metadata.create_all(eg)
+    upgrade_db()
     create_fts()
     create_triggers()
+    move_content_to_pages()
@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+from typing import Any, Callable
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from database import DBSession
+from models import Document, Meta, OcrJob, Page
+from run_stats import FileTimer, RunStats
+
+
+# Jobs that failed this many times are left for ocr-status to report
+MAX_ATTEMPTS = 3
+
+# Error of jobs whose files are all gone from where they were indexed,
+# update-index gives them their attempts back when it finds them moved
+FILE_MISSING = "File not found, run update-index if it was moved"
+
+
+@dataclass
+class OcrStatus:
+    jobs: int
+    pages: int
+    failed: list[tuple[str | None, str | None]]
+    # Path and page count of the next jobs to run
+    upcoming: list[tuple[str | None, int]]
+
+
+def _path_of(sha256_column):
+    return select(func.min(Document.path)).where(Document.sha256 == sha256_column).scalar_subquery()
+
+
+def ocr_status(db_session: Session, upcoming: int = 10) -> OcrStatus:
+    jobs, pages = db_session.execute(
+        select(func.count(), func.coalesce(func.sum(OcrJob.pages), 0)).where(OcrJob.attempts < MAX_ATTEMPTS)
+    ).one()
+    failed = db_session.execute(
+        select(_path_of(OcrJob.sha256), OcrJob.error).where(OcrJob.attempts >= MAX_ATTEMPTS)
+    ).tuples().all()
+    next_jobs = db_session.execute(
+        select(_path_of(OcrJob.sha256), OcrJob.pages)
+        .where(OcrJob.attempts < MAX_ATTEMPTS)
+        .order_by(OcrJob.priority, OcrJob.created)
+        .limit(upcoming)
+    ).tuples().all()
+    return OcrStatus(jobs, pages, list(failed), list(next_jobs))
+
+
+def next_job(db_session: Session) -> OcrJob | None:
+    return db_session.scalars(
+        select(OcrJob).where(OcrJob.attempts < MAX_ATTEMPTS).order_by(OcrJob.priority, OcrJob.created).limit(1)
+    ).first()
+
+
+def run_job(db_session: Session, job: OcrJob, workers: int | None = None, stats: RunStats | None = None) -> bool:
+    # OCRs any file still holding the job's bytes and replaces the pages of
+    # every row with that hash, the page triggers refresh the FTS index.
+    # indexer pulls in PyMuPDF, which ocr-status doesn't need.
+    from indexer import LoadedFile, extract_content
+
+    rows = db_session.execute(select(Document.id, Document.path).where(Document.sha256 == job.sha256)).all()
+    paths = [row.path for row in rows]
+    texts = None
+    timed_out = 0
+    missing = False
+    timer = FileTimer()
+    try:
+        for path in paths:
+            if not Path(path).is_file():
+                missing = True
+                continue
+            with timer.stage("hash"):
+                loaded = LoadedFile(Path(path))
+            with loaded:
+                if loaded.sha256 != job.sha256:
+                    # Changed since it was indexed, the new version has its own job
+                    continue
+                with timer.stage("ocr"):
+                    texts, timed_out = extract_content(loaded, workers, timer=timer)
+            break
+    except Exception as e:
+        logging.error(f"OCR of {paths[0] if paths else job.sha256} failed: {e}")
+        job.attempts += 1
+        job.error = str(e)
+        db_session.commit()
+        if stats:
+            stats.count("failed")
+        return False
+    if texts is None and missing:
+        # Still indexed, the file may only have moved while nothing was watching
+        job.attempts += 1
+        job.error = FILE_MISSING
+        db_session.commit()
+        if stats:
+            stats.count("file missing")
+        return False
+    with timer.stage("commit"):
+        if texts is not None:
+            for row in rows:
+                Page.store(db_session, row.id, texts)
+            Meta.bump_generation(db_session)
+        if timed_out:
+            # The pages that were read are kept, the job stays queued for the rest
+            job.attempts += 1
+            job.error = f"OCR of {timed_out} page(s) timed out"
+        else:
+            # No row left with this hash, or every file changed since: whatever
+            # replaced them was indexed on its own
+            db_session.delete(job)
+        db_session.commit()
+    if stats:
+        stats.count("ocr" if texts is not None else "dropped")
+        stats.add_file(paths[0] if paths else job.sha256, timer, job.pages if texts is not None else 0)
+    return texts is not None
+
+
+def run_next(workers: int | None = None, stats: RunStats | None = None) -> bool:
+    # Runs the highest priority job, False when the queue is empty
+    with DBSession() as db_session:
+        job = next_job(db_session)
+        if job is None:
+            return False
+        run_job(db_session, job, workers, stats)
+        return True
+
+
+def drain(on_progress: Callable[[int], Any] | None = None, workers: int | None = None,
+          stats: RunStats | None = None) -> None:
+    while run_next(workers, stats):
+        if on_progress:
+            on_progress(1)
@@ -1,33 +1,218 @@
-import fitz 
-import pytesseract
-from pdf2image import convert_from_path
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+import hashlib
+import logging
+import os
+import time
+import fitz
+from PIL import Image
 from pathlib import Path
 
-def extract_text_with_ocr(pdf_path: str | Path, lang: str = "por") -> str:
-    pdf_path = Path(pdf_path)
-    if not pdf_path.exists():
-        raise FileNotFoundError(f"PDF not found: {pdf_path}")
+import config
+from cache import ExtractionCache
 
-    text_output = []
 
-    # Open with PyMuPDF
-    doc = fitz.open(pdf_path)
-    for page_num, page in enumerate(doc, start=1):
-        text = page.get_text()
-        if text.strip():
-            # Page already has selectable text
-            text_output.append(text)
-        else:
-            # No text -> likely scanned image, do OCR
-            images = convert_from_path(
-                str(pdf_path), dpi=300, first_page=page_num, last_page=page_num
-            )
-            for img in images:
-                ocr_text = pytesseract.image_to_string(img, lang=lang)
-                text_output.append(ocr_text)
-
-    doc.close()
-    return "\n".join(text_output)
+@dataclass
+class PageText:
+    number: int
+    text: str
+    ocr: bool = False
+    cached: bool = False
+    seconds: float = 0.0
+    # Scanned page left for a later OCR pass
+    pending: bool = False
+    # Why OCR was not needed: "blank" or "logo"
+    skipped: str | None = None
+    # Resolution the page was OCR'd at
+    dpi: int = 0
+    timed_out: bool = False
+    # Square inches
+    area: float = 0.0
+
+
+@dataclass
+class OcrPlan:
+    skip: str | None
+    dpi: int
+
+
+def page_area(page: fitz.Page) -> float:
+    return page.rect.width * page.rect.height / 72 ** 2
+
+
+def ink_ratio(page: fitz.Page) -> float:
+    # Share of dark pixels in a thumbnail sized render, MuPDF decodes big scans at reduced size for it
+    pix = page.get_pixmap(dpi=config.OCR_PROBE_DPI, colorspace=fitz.csGRAY)
+    histogram = Image.frombytes("L", (pix.width, pix.height), pix.samples).histogram()
+    return sum(histogram[:config.OCR_INK_LEVEL]) / max(1, pix.width * pix.height)
+
+
+def plan_ocr(page: fitz.Page) -> OcrPlan:
+    # Decides whether a page without a text layer is worth OCR and at what resolution
+    images = page.get_image_info()
+    contents = page.read_contents().strip()
+    if not images and not contents:
+        return OcrPlan("blank", 0)
+    page_rect_area = max(page.rect.width * page.rect.height, 1)
+    # A content stream this short draws the image and nothing else
+    if len(images) == 1 and len(contents) < 200:
+        bbox = fitz.Rect(images[0]["bbox"])
+        if bbox.width * bbox.height / page_rect_area < config.OCR_LOGO_MAX_AREA:
+            return OcrPlan("logo", 0)
+    if ink_ratio(page) < config.OCR_BLANK_INK:
+        return OcrPlan("blank", 0)
+
+    dpi = config.OCR_DPI
+    if images:
+        # Rendering above the resolution of a scan adds pixels but no detail. The
+        # glyphs are as fine as the scan, so it stands in for their size. Only an
+        # image covering most of the page counts as the scan.
+        biggest = max(images, key=lambda img: abs(fitz.Rect(img["bbox"])))
+        bbox = fitz.Rect(biggest["bbox"])
+        if bbox.width > 0 and bbox.height * 2 > page.rect.height:
+            scan_dpi = round(biggest["width"] / (bbox.width / 72))
+            dpi = min(dpi, max(config.OCR_MIN_DPI, scan_dpi))
+    max_dpi = int((config.OCR_MAX_PIXELS / max(page_area(page), 1e-6)) ** 0.5)
+    return OcrPlan(None, max(72, min(dpi, max_dpi)))
+
+
+def ocr_savings(pages: list[PageText]) -> tuple[int, float, float]:
+    # Pages skipped, and the estimated seconds saved by skipping them and by
+    # OCR at lower resolutions, against OCR of every page without text at
+    # OCR_DPI. The cost per megapixel is measured on the pages that were OCR'd,
+    # if there were any.
+    done = [p for p in pages if p.ocr and not p.timed_out]
+    megapixels = sum(p.area * p.dpi ** 2 for p in done) / 1e6
+    rate = sum(p.seconds for p in done) / megapixels if megapixels else config.OCR_SECONDS_PER_MPX
+    by_skipping = by_dpi = 0.0
+    for p in pages:
+        full = p.area * config.OCR_DPI ** 2 / 1e6
+        if p.skipped:
+            by_skipping += full * rate
+        elif p.ocr:
+            by_dpi += (full - p.area * p.dpi ** 2 / 1e6) * rate
+    return sum(1 for p in pages if p.skipped), by_skipping, by_dpi
+
+
+def page_hash(page: fitz.Page, lang: str) -> str:
+    # Drawing commands plus the raw bytes of every image they reference
+    sha256 = hashlib.sha256(lang.encode())
+    sha256.update(page.read_contents())
+    for img in page.get_images(full=True):
+        sha256.update(page.parent.xref_stream_raw(img[0]) or b"")
+    return sha256.hexdigest()
+
+
+def render_page(page: fitz.Page, dpi: int = config.OCR_DPI) -> Image.Image:
+    # Grayscale is what Tesseract works on anyway and takes a third of the memory
+    pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return Image.frombytes("L", (pix.width, pix.height), pix.samples)
+
 
+def ocr_image(img: Image.Image, lang: str) -> str:
+    # Imported on first use, most runs never OCR a page
+    import pytesseract
 
+    # pytesseract kills Tesseract once the timeout passes and raises RuntimeError
+    return pytesseract.image_to_string(img, lang=lang, timeout=config.OCR_PAGE_TIMEOUT)
 
+
+def _ocr_page(page_text: PageText, img: Image.Image, lang: str) -> None:
+    start = time.perf_counter()
+    try:
+        page_text.text = ocr_image(img, lang)
+    except RuntimeError as e:
+        if "timeout" not in str(e).lower():
+            raise
+        page_text.timed_out = True
+        logging.warning(f"OCR of page {page_text.number} gave up after {config.OCR_PAGE_TIMEOUT}s")
+    page_text.seconds += time.perf_counter() - start
+    logging.debug(f"OCR page {page_text.number} at {page_text.dpi} dpi: {page_text.seconds:.2f}s")
+
+
+def extract_pages(doc: fitz.Document, lang: str = "por", workers: int | None = None,
+                  cache: ExtractionCache | None = None, ocr: bool = True) -> list[PageText]:
+    # With ocr=False pages without a text layer (and no cached OCR text) are
+    # returned empty and marked pending. Blank pages and lone logos are never
+    # OCR'd, nor queued for it.
+    workers = workers or config.OCR_WORKERS
+    if workers > 1:
+        # Parallelism comes from the page pool, keep each tesseract single threaded
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+    pages: list[PageText] = []
+    hashes: dict[int, str] = {}
+    pending: set[Future] = set()
+    with ThreadPoolExecutor(workers) as pool:
+        for page_num, page in enumerate(doc, start=1):
+            text = page.get_text()
+            page_text = PageText(page_num, text, area=page_area(page))
+            pages.append(page_text)
+            if text.strip():
+                # Page already has selectable text
+                continue
+
+            if cache is not None:
+                hashes[page_num] = page_hash(page, lang)
+                cached = cache.get_pages([hashes[page_num]])
+                if cached:
+                    page_text.text = cached[hashes[page_num]]
+                    page_text.cached = True
+                    continue
+
+            plan = plan_ocr(page)
+            if plan.skip:
+                page_text.skipped = plan.skip
+                continue
+
+            if not ocr:
+                page_text.pending = True
+                continue
+
+            # No text -> likely scanned image, do OCR.
+            # Only a few rendered pages may wait for a worker at a time.
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            start = time.perf_counter()
+            img = render_page(page, plan.dpi)
+            page_text.ocr = True
+            page_text.dpi = plan.dpi
+            page_text.seconds = time.perf_counter() - start
+            pending.add(pool.submit(_ocr_page, page_text, img, lang))
+        for future in pending:
+            future.result()
+
+    if cache is not None:
+        # A page that timed out gets another chance next time
+        cache.put_pages({hashes[p.number]: p.text for p in pages if p.ocr and not p.timed_out})
+
+    ocr_pages = [p for p in pages if p.ocr]
+    if ocr_pages:
+        total = sum(p.seconds for p in ocr_pages)
+        slowest = max(ocr_pages, key=lambda p: p.seconds)
+        skipped, by_skipping, by_dpi = ocr_savings(pages)
+        saved = by_skipping + by_dpi
+        logging.info(
+            f"OCR {doc.name}: {len(ocr_pages)} pages in {total:.1f}s, "
+            f"slowest page {slowest.number} ({slowest.seconds:.1f}s), "
+            f"{skipped} skipped, about {saved:.1f}s saved"
+        )
+    return pages
+
+
+def join_pages(pages: list[PageText]) -> str:
+    return "\n".join(p.text for p in pages)
+
+
+def extract_text_with_ocr(pdf_path: str | Path, lang: str = "por", workers: int | None = None,
+                          cache: ExtractionCache | None = None) -> str:
+    pdf_path = Path(pdf_path)
+    if not pdf_path.exists():
+        raise FileNotFoundError(f"PDF not found: {pdf_path}")
+
+    # Open with PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        pages = extract_pages(doc, lang, workers, cache)
+    return join_pages(pages)
@@ -0,0 +1,188 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+import logging
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+import config
+from cache import get_cache
+from database import DBSession
+from indexer import (
+    FileStat, LoadedFile, Reconciler, Res, extract_content, generate_pdf_thumbnail,
+    needs_content
+)
+from models import Document
+from run_stats import FileTimer
+
+
+# Functions below run inside the worker processes, which only read from the database
+
+def is_indexed(sha256: str) -> bool:
+    with DBSession() as db_session:
+        return db_session.query(Document.id).where(Document.sha256 == sha256).first() is not None
+
+
+def ingest_file(path: str, known_sha256: str | None, extract: bool,
+                ocr_workers: int) -> tuple[str, list[str] | None, int, FileTimer]:
+    # Hash, text and thumbnail all come from a single read of the file, mapped
+    # since a worker killed by a file truncated under it is only retried.
+    # Scanned pages are left to the OCR queue.
+    timer = FileTimer()
+    with timer.stage("hash"):
+        loaded = LoadedFile(Path(path), use_mmap=True)
+    with loaded:
+        if not extract and (loaded.sha256 == known_sha256 or is_indexed(loaded.sha256)):
+            # Same, moved or duplicated: the text is already in the index
+            return loaded.sha256, None, 0, timer
+        with timer.stage("extract"):
+            pages, ocr_pages = extract_content(loaded, ocr_workers, ocr=False, timer=timer)
+        with timer.stage("thumbnail"):
+            generate_pdf_thumbnail(Document(path=path, sha256=loaded.sha256), pdf=loaded.pdf)
+        return loaded.sha256, pages, ocr_pages, timer
+
+
+@dataclass
+class Task:
+    path: Path
+    stat: FileStat
+    known_sha256: str | None
+    extract: bool = False
+
+
+@dataclass
+class Failure:
+    path: Path
+    error: str
+
+
+# Hashing, extraction and thumbnails run in a process pool. The calling process is
+# the only database writer: it applies results as they arrive and commits every few seconds.
+@dataclass
+class Pipeline:
+    reconciler: Reconciler
+    jobs: int
+    verify: bool = False
+    failures: list[Failure] = field(default_factory=list)
+
+    def run(self, files: Iterable[tuple[Path, FileStat | None]],
+            on_progress: Callable[[int], Any] | None = None) -> None:
+        # Each file comes with its stat when the caller has one already
+        self._on_progress = on_progress
+        self._pending: dict[Future, Task] = {}
+        self._crashed: list[Task] = []
+        # Share the cores between documents and the pages of each document
+        self._ocr_workers = max(1, config.OCR_WORKERS // self.jobs)
+        # Create the cache tables before the workers race to do it
+        get_cache()
+        self._pool = ProcessPoolExecutor(self.jobs)
+        max_pending = self.jobs * 4
+        files = iter(files)
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(self._pending) < max_pending:
+                    found = next(files, None)
+                    if found is None:
+                        exhausted = True
+                    else:
+                        self._start(Path(found[0]), found[1])
+                if self._crashed:
+                    self._recover()
+                    continue
+                if not self._pending:
+                    if exhausted:
+                        break
+                    continue
+                done, _ = wait(self._pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(self._pending.pop(future), future)
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+        self.reconciler.commit()
+
+    def report(self) -> None:
+        if not self.failures:
+            return
+        print(f"{len(self.failures)} file(s) could not be indexed:")
+        for failure in self.failures:
+            print(f"  {failure.path}: {failure.error}")
+
+    def _start(self, path: Path, stat: FileStat | None) -> None:
+        try:
+            if stat is None:
+                stat = FileStat.of(path)
+            entry = self.reconciler.lookup(path)
+        except Exception as e:
+            self._fail(path, e)
+            return
+        if entry and entry.stat == stat and not self.verify:
+            self._apply(path, Res("same", entry.sha256, stat, entry), None)
+            return
+        self._submit(Task(path, stat, entry.sha256 if entry else None))
+
+    def _run_task(self, pool: ProcessPoolExecutor, task: Task) -> Future:
+        return pool.submit(ingest_file, str(task.path), task.known_sha256, task.extract, self._ocr_workers)
+
+    def _submit(self, task: Task) -> None:
+        try:
+            self._pending[self._run_task(self._pool, task)] = task
+        except BrokenProcessPool:
+            self._crashed.append(task)
+
+    def _finish(self, task: Task, future: Future) -> None:
+        try:
+            value = future.result()
+        except BrokenProcessPool:
+            self._crashed.append(task)
+            return
+        except Exception as e:
+            self._fail(task.path, e)
+            return
+        self._complete(task, value)
+
+    def _complete(self, task: Task, value: tuple[str, list[str] | None, int, FileTimer]) -> None:
+        sha256, pages, ocr_pages, timer = value
+        res = self.reconciler.classify(task.path, sha256, task.stat)
+        if needs_content(res) and pages is None and not task.extract:
+            # The matching row went away before this file was classified
+            self._submit(Task(task.path, task.stat, None, extract=True))
+            return
+        self.reconciler.stats.add_file(task.path, timer, ocr_pages)
+        self._apply(task.path, res, pages, ocr_pages)
+
+    def _recover(self) -> None:
+        # A dead worker breaks the whole pool, so every task in flight fails with it.
+        # Rerun those tasks one at a time to find the file that actually crashes.
+        self._pool.shutdown(cancel_futures=True)
+        crashed = self._crashed + list(self._pending.values())
+        self._crashed, self._pending = [], {}
+        self._pool = ProcessPoolExecutor(self.jobs)
+        logging.warning(f"Worker process died, retrying {len(crashed)} file(s) in isolation")
+        for task in crashed:
+            with ProcessPoolExecutor(1) as quarantine:
+                future = self._run_task(quarantine, task)
+                try:
+                    value = future.result()
+                except BrokenProcessPool:
+                    self._fail(task.path, "worker process crashed")
+                    continue
+                except Exception as e:
+                    self._fail(task.path, e)
+                    continue
+            self._complete(task, value)
+
+    def _apply(self, path: Path, res: Res, pages: list[str] | None, ocr_pages: int = 0) -> None:
+        self.reconciler.apply(path, res, pages, ocr_pages)
+        self._done()
+
+    def _fail(self, path: Path, error: Exception | str) -> None:
+        logging.error(f"Error indexing {path}: {error}")
+        self.failures.append(Failure(path, str(error)))
+        self.reconciler.stats.count("failed")
+        self._done()
+
+    def _done(self) -> None:
+        self.reconciler.maybe_commit()
+        if self._on_progress:
+            self._on_progress(1)
@@ -1,9 +1,87 @@
-from typing import Iterable
+from bisect import bisect_right
+from collections import OrderedDict
+import threading
+from sqlalchemy.orm import Session
 
-from database import DBSession
-from models import Document
+import config
+from models import Document, Meta, SearchMatch, SearchPage
 
+PAGE_SIZE = 30
 
-def search_documents(query: str) -> Iterable[Document]:
-    with DBSession() as db_session:
-        return Document.search(db_session, query, 30)
\ No newline at end of file
+
+class SearchCache:
+    # Result pages keyed by query, page size and cursor. Each entry is tagged with
+    # the index generation it was computed at and is only served while the
+    # generation hasn't moved on; stale entries age out of the LRU.
+    # Ranking has to score every match whatever the page, so the (rank, id) of
+    # all matches of a query is kept too and later pages are cut from it.
+
+    def __init__(self, entries: int = config.SEARCH_CACHE_ENTRIES,
+                 rankings: int = config.SEARCH_CACHE_RANKINGS) -> None:
+        self.entries = entries
+        self.rankings = rankings
+        self._pages: OrderedDict[tuple, tuple[int, SearchPage]] = OrderedDict()
+        self._rankings: OrderedDict[str, tuple[int, list[SearchMatch]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def search_page(self, db_session: Session, query: str, page_size: int = PAGE_SIZE,
+                    cursor: tuple[float, int] | None = None) -> SearchPage:
+        return self.lookup(db_session, query, page_size, cursor)[0]
+
+    def lookup(self, db_session: Session, query: str, page_size: int = PAGE_SIZE,
+               cursor: tuple[float, int] | None = None) -> tuple[SearchPage, bool]:
+        # The page and whether it came from the cache. The generation is read in
+        # the same transaction as the search, so the tag matches the results.
+        generation = Meta.generation(db_session)
+        query = " ".join(query.split())
+        key = (query, page_size, tuple(cursor) if cursor else None)
+        with self._lock:
+            entry = self._pages.get(key)
+            if entry is not None and entry[0] == generation:
+                self.hits += 1
+                self._pages.move_to_end(key)
+                return entry[1], True
+            self.misses += 1
+        page = self._page(db_session, query, page_size, cursor, generation)
+        with self._lock:
+            self._pages[key] = (generation, page)
+            self._pages.move_to_end(key)
+            if len(self._pages) > self.entries:
+                self._pages.popitem(last=False)
+        return page, False
+
+    def _ranking(self, db_session: Session, query: str, generation: int) -> list[SearchMatch]:
+        with self._lock:
+            entry = self._rankings.get(query)
+            if entry is not None and entry[0] == generation:
+                self._rankings.move_to_end(query)
+                return entry[1]
+        ranking = Document.rank(db_session, query)
+        with self._lock:
+            self._rankings[query] = (generation, ranking)
+            self._rankings.move_to_end(query)
+            if len(self._rankings) > self.rankings:
+                self._rankings.popitem(last=False)
+        return ranking
+
+    def _page(self, db_session: Session, query: str, page_size: int, cursor: tuple[float, int] | None,
+              generation: int) -> SearchPage:
+        # Cursors are only ever compared with ranks from the same ranking, a
+        # rank computed again could differ in its last bits
+        ranking = self._ranking(db_session, query, generation)
+        start = bisect_right(ranking, tuple(cursor), key=lambda m: m.cursor) if cursor else 0
+        matches = ranking[start:start + page_size]
+        next_cursor = matches[-1].cursor if start + page_size < len(ranking) else None
+        return SearchPage(Document.results(db_session, query, matches), next_cursor)
+
+    def stats(self) -> dict:
+        searches = self.hits + self.misses
+        return {"searches": searches, "hits": self.hits, "misses": self.misses,
+                "hit_ratio": self.hits / searches if searches else 0.0, "entries": len(self._pages),
+                "rankings": len(self._rankings)}
+
+
+# Shared by the GUI's search worker, which opens its own session so the query
+# in flight can be interrupted
+search_cache = SearchCache()
@@ -0,0 +1,162 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+import json
+from pathlib import Path
+import time
+from typing import Iterator
+
+import config
+
+
+# Stages in the order a run goes through them, any others are listed after these
+STAGES = ("walk", "hash", "extract", "ocr", "thumbnail", "commit", "delete")
+
+
+@dataclass
+class FileTimer:
+    # Filled in wherever the file is processed, worker processes send it back with their result
+    stages: dict[str, float] = field(default_factory=dict)
+    counters: dict[str, float] = field(default_factory=dict)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name: str, value: float = 1) -> None:
+        if value:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    @property
+    def seconds(self) -> float:
+        return sum(self.stages.values())
+
+
+@dataclass
+class FileRecord:
+    path: str
+    seconds: float
+    stages: dict[str, float]
+    ocr_pages: int = 0
+
+
+@dataclass
+class RunStats:
+    # Timings and counters of one update-index or ocr run, saved as JSON in RUNSDIR.
+    # Stage totals add up the time of every file, with worker processes they can
+    # be more than the wall clock time of the run.
+    command: str = ""
+    jobs: int = 1
+    started: str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+    seconds: float = 0.0
+    files: int = 0
+    ocr_pages: int = 0
+    actions: dict[str, int] = field(default_factory=dict)
+    stages: dict[str, float] = field(default_factory=dict)
+    # Totals of the counters of every file
+    counters: dict[str, float] = field(default_factory=dict)
+    slowest: list[FileRecord] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, action: str, n: int = 1) -> None:
+        if n:
+            self.actions[action] = self.actions.get(action, 0) + n
+
+    def add_file(self, path: Path | str, timer: FileTimer, ocr_pages: int = 0) -> None:
+        self.files += 1
+        self.ocr_pages += ocr_pages
+        for name, seconds in timer.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        for name, value in timer.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.slowest.append(FileRecord(Path(path).as_posix(), timer.seconds, dict(timer.stages), ocr_pages))
+        if len(self.slowest) > 2 * config.STATS_SLOWEST_FILES:
+            self._trim()
+
+    def _trim(self) -> None:
+        self.slowest.sort(key=lambda r: r.seconds, reverse=True)
+        del self.slowest[config.STATS_SLOWEST_FILES:]
+
+    def finish(self) -> None:
+        self.seconds = time.perf_counter() - self._start
+        self._trim()
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RunStats":
+        data = dict(data)
+        data["slowest"] = [FileRecord(**r) for r in data.get("slowest", [])]
+        return cls(**data)
+
+    def save(self, folder: Path = config.RUNSDIR) -> Path:
+        self.finish()
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"{self.started.replace(':', '')}-{self.command}.json"
+        path.write_text(json.dumps(self.to_dict(), indent=2), encoding="utf-8")
+        for old in run_files(folder)[:-config.RUNS_KEPT]:
+            old.unlink()
+        return path
+
+
+def run_files(folder: Path = config.RUNSDIR) -> list[Path]:
+    # Oldest first, the names start with the time the run started
+    return sorted(folder.glob("*.json")) if folder.is_dir() else []
+
+
+def load_runs(count: int = 1, folder: Path = config.RUNSDIR) -> list[RunStats]:
+    files = run_files(folder)[-count:] if count > 0 else []
+    return [RunStats.from_dict(json.loads(p.read_text(encoding="utf-8"))) for p in files]
+
+
+def ordered_stages(stages: dict[str, float]) -> list[tuple[str, float]]:
+    known = [(name, stages[name]) for name in STAGES if name in stages]
+    return known + sorted((name, s) for name, s in stages.items() if name not in STAGES)
+
+
+def format_run(run: RunStats) -> str:
+    lines = [f"{run.started}  {run.command}  jobs={run.jobs}  {run.seconds:.1f}s, {run.files} file(s) read"]
+    if run.actions:
+        lines.append("  " + ", ".join(f"{n} {action}" for action, n in sorted(run.actions.items())))
+    if run.ocr_pages:
+        lines.append(f"  {run.ocr_pages} page(s) {'OCRed' if run.command == 'ocr' else 'queued for OCR'}")
+    for name, value in sorted(run.counters.items()):
+        lines.append(f"  {name}: {value:.1f}" if isinstance(value, float) else f"  {name}: {value}")
+    total = sum(run.stages.values()) or 1.0
+    for name, seconds in ordered_stages(run.stages):
+        lines.append(f"  {name:10} {seconds:10.2f}s  {seconds / total:6.1%}")
+    if run.slowest:
+        lines.append("  Slowest files:")
+        for record in run.slowest:
+            parts = ", ".join(f"{name} {s:.2f}s" for name, s in ordered_stages(record.stages))
+            ocr = f", {record.ocr_pages} OCR page(s)" if record.ocr_pages else ""
+            lines.append(f"  {record.seconds:8.2f}s  {record.path}  ({parts}{ocr})")
+    return "\n".join(lines)
+
+
+def save_profile(profiler, folder: Path = config.RUNSDIR, top: int = 25) -> Path:
+    # Only the main process is profiled, work done in --jobs workers shows up as waiting
+    import pstats
+
+    profiler.disable()
+    folder.mkdir(parents=True, exist_ok=True)
+    path = folder / f"{datetime.now().strftime('%Y-%m-%dT%H%M%S')}.prof"
+    profiler.dump_stats(str(path))
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+    print(f"Profile written to {path}")
+    return path
@@ -0,0 +1,125 @@
+from dataclasses import asdict
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+import config
+from database import DBSession
+from models import Document
+from repo import PAGE_SIZE, SearchCache
+
+
+# One request per line and one response per line, both JSON objects:
+#   {"query": "...", "limit": 30, "cursor": [rank, id]}  ->  {"results": [...], "cursor": [rank, id] | null, "cached": false}
+#   {"op": "ping"}   ->  {"ok": true}
+#   {"op": "stats"}  ->  {"searches": ..., "hits": ..., "misses": ..., "hit_ratio": ..., "entries": ...}
+# Errors come back as {"error": "..."}.
+
+
+def search_response(db_session: Session, request: dict, cache: SearchCache | None = None) -> dict:
+    cursor = request.get("cursor")
+    limit = request.get("limit")
+    limit = PAGE_SIZE if limit is None else int(limit)
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    args = (db_session, str(request.get("query", "")), limit, tuple(cursor) if cursor else None)
+    if cache is not None:
+        page, cached = cache.lookup(*args)
+    else:
+        page, cached = Document.search_page(*args), False
+    return {"results": [asdict(r) for r in page.results], "cursor": page.cursor, "cached": cached}
+
+
+class SearchService:
+    # Holds one session, and so one SQLite connection, for the life of the daemon:
+    # its page cache stays warm and sqlite3 keeps the statements it prepared.
+    # Answers come from a SearchCache, which the indexer invalidates by bumping
+    # the index generation.
+
+    def __init__(self) -> None:
+        self.db_session = DBSession()
+        self.cache = SearchCache()
+        self._lock = threading.Lock()
+
+    def handle(self, request: dict) -> dict:
+        op = request.get("op", "search")
+        if op == "ping":
+            return {"ok": True}
+        if op == "stats":
+            return self.cache.stats()
+        if op != "search":
+            return {"error": f"unknown op {op!r}"}
+        with self._lock:
+            try:
+                return search_response(self.db_session, request, self.cache)
+            finally:
+                # Nothing stays open between requests, writers are never blocked by the daemon
+                self.db_session.rollback()
+
+    def close(self) -> None:
+        self.db_session.close()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    server: "SearchServer"
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            start = time.perf_counter()
+            try:
+                response = self.server.service.handle(json.loads(line))
+            except Exception as e:
+                logging.exception("Search request failed")
+                response = {"error": str(e)}
+            response["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class SearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, service: SearchService) -> None:
+        self.service = service
+        super().__init__(path, RequestHandler)
+
+
+def is_listening(path: str) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(path: str = str(config.SOCKET_FILE)) -> None:
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("serve needs Unix domain sockets, which this platform doesn't have")
+    if os.path.exists(path):
+        if is_listening(path):
+            raise RuntimeError(f"Another daemon is already listening on {path}")
+        # Left behind by a daemon that didn't shut down cleanly
+        os.unlink(path)
+    service = SearchService()
+    server = SearchServer(path, service)
+    # Stopped by kill the same way as by Ctrl+C, so the socket is removed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    print(f"Listening on {path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        os.unlink(path)
@@ -4,9 +4,36 @@ import shutil
 import subprocess
 
 
-def startfile(path: str | Path) -> None:
+# How PDF viewers are told which page to open at
+PAGE_ARGS = {
+    "okular": ["--page", "{page}"],
+    "evince": ["--page-index", "{page}"],
+    "zathura": ["--page", "{page}"],
+}
+
+
+def get_linux_pdf_viewer() -> str | None:
+    # The default PDF application, if it is one that can open at a page
+    try:
+        desktop = subprocess.run(
+            ["xdg-mime", "query", "default", "application/pdf"], capture_output=True, text=True
+        ).stdout.lower()
+    except OSError:
+        return None
+    for viewer in PAGE_ARGS:
+        if viewer in desktop and shutil.which(viewer) is not None:
+            return viewer
+    return None
+
+
+def startfile(path: str | Path, page: int | None = None) -> None:
     if os.name == "nt":
         os.startfile(path) #type: ignore
+        return
+    viewer = get_linux_pdf_viewer() if page else None
+    if viewer:
+        args = [arg.format(page=page) for arg in PAGE_ARGS[viewer]]
+        subprocess.Popen([viewer, *args, str(path)])
     else:
         os.system(f'xdg-open "{path}"')
 
@@ -0,0 +1,114 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+import os
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import config
+
+
+class IgnoreRules:
+    # Patterns from the .indexerignore file at the root, one per line as in
+    # .gitignore: without a slash a pattern matches a name at any depth, with
+    # one it matches the path from the root, and a trailing slash limits it to
+    # folders. Negation with ! is not supported. The index folder is always left out.
+
+    def __init__(self, patterns: Iterable[str] = ()) -> None:
+        self.names: list[tuple[str, bool]] = []
+        self.paths: list[tuple[str, bool]] = [(config.INDEXDIR.as_posix(), True)]
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            dirs_only = line.endswith("/")
+            line = line.rstrip("/")
+            if "/" in line:
+                self.paths.append((line.lstrip("/"), dirs_only))
+            else:
+                self.names.append((line, dirs_only))
+
+    @classmethod
+    def load(cls, root: Path) -> "IgnoreRules":
+        try:
+            text = (root / config.IGNORE_FILE).read_text(encoding="utf-8")
+        except FileNotFoundError:
+            text = ""
+        return cls(text.splitlines())
+
+    def ignored(self, path: str, name: str, is_dir: bool) -> bool:
+        # path is relative to the root, name is its last part
+        return (
+            any(fnmatchcase(name, p) for p, dirs_only in self.names if is_dir or not dirs_only)
+            or any(fnmatchcase(path, p) for p, dirs_only in self.paths if is_dir or not dirs_only)
+        )
+
+    def ignores(self, path: str) -> bool:
+        # Whether a file is left out by its own name or by any folder above it
+        parts = path.split("/")
+        for i in range(1, len(parts)):
+            if self.ignored("/".join(parts[:i]), parts[i - 1], True):
+                return True
+        return self.ignored(path, parts[-1], False)
+
+
+ScanResult = tuple[list[tuple[str, os.stat_result]], list[tuple[str, str]], list[OSError]]
+
+
+def walk_pdfs(root: Path, onerror: Callable[[OSError], None] | None = None, rules: IgnoreRules | None = None,
+              workers: int = 1) -> Iterator[tuple[str, os.stat_result]]:
+    # Streams the path, as stored in the index, and stat of every PDF below root.
+    # Uses os.scandir directly, so no Path object is built per file and the file
+    # type comes from the directory listing. Ignored folders are never entered.
+    # With workers > 1 sibling folders are listed in parallel, which pays off on
+    # network filesystems where every listing and stat is a round trip; files
+    # then come out in no particular order.
+    rules = rules if rules is not None else IgnoreRules.load(root)
+    root_prefix = "" if root == Path(".") else root.as_posix() + "/"
+
+    def scan(folder: str, prefix: str) -> ScanResult:
+        files: list[tuple[str, os.stat_result]] = []
+        folders: list[tuple[str, str]] = []
+        errors: list[OSError] = []
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    path = f"{prefix}{entry.name}"
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not rules.ignored(path[len(root_prefix):], entry.name, True):
+                                folders.append((entry.path, f"{path}/"))
+                        elif (entry.name.lower().endswith(".pdf") and entry.is_file()
+                              and not rules.ignored(path[len(root_prefix):], entry.name, False)):
+                            files.append((path, entry.stat()))
+                    except OSError as e:
+                        errors.append(e)
+        except OSError as e:
+            errors.append(e)
+        return files, folders, errors
+
+    def report(errors: list[OSError]) -> None:
+        if onerror:
+            for e in errors:
+                onerror(e)
+
+    if workers <= 1:
+        stack = [(str(root), root_prefix)]
+        while stack:
+            files, folders, errors = scan(*stack.pop())
+            report(errors)
+            yield from files
+            stack.extend(folders)
+        return
+
+    pool = ThreadPoolExecutor(workers)
+    try:
+        pending: set[Future[ScanResult]] = {pool.submit(scan, str(root), root_prefix)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, folders, errors = future.result()
+                pending.update(pool.submit(scan, *folder) for folder in folders)
+                report(errors)
+                yield from files
+    finally:
+        pool.shutdown(cancel_futures=True)
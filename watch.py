@@ -1,76 +1,294 @@
-from datetime import datetime
+from dataclasses import dataclass
+import logging
+import os
 from pathlib import Path
+import threading
+from typing import Literal
+from sqlalchemy import select
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import time
 
+import config
 from database import DBSession
-from indexer import index_pdf, on_delete_file
+from indexer import Reconciler, index_file
+from models import Document
+import ocr_queue
+from walk import IgnoreRules, walk_pdfs
+
+
+Action = Literal["index", "delete"]
+
+
+@dataclass
+class Pending:
+    action: Action
+    first_seen: float
+    due: float
+    stat: tuple[int, int] | None = None
+
+
+def lower_thread_priority() -> None:
+    # Niceness is per thread on Linux, elsewhere this is best effort
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+
+def size_and_mtime(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class EventQueue:
+    # Pending changes keyed by path. A burst of events for one path collapses into
+    # its last action, and a file is only handed out once its size and mtime have
+    # stayed the same for the debounce interval.
+
+    def __init__(self, debounce: float = config.WATCH_DEBOUNCE_SECONDS) -> None:
+        self.debounce = debounce
+        self._items: dict[str, Pending] = {}
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, path: str | Path, action: Action) -> None:
+        key = Path(path).as_posix()
+        stat = size_and_mtime(key) if action == "index" else None
+        now = time.monotonic()
+        with self._cond:
+            item = self._items.get(key)
+            first_seen = item.first_seen if item else now
+            self._items[key] = Pending(action, first_seen, now + self.debounce, stat)
+            self._cond.notify()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def lag(self) -> float:
+        # Seconds the oldest pending change has been waiting
+        with self._cond:
+            oldest = min((item.first_seen for item in self._items.values()), default=None)
+        return 0.0 if oldest is None else time.monotonic() - oldest
+
+    def take(self, max_items: int) -> list[tuple[str, Action]]:
+        # Blocks until some paths are due, returns an empty list once closed
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                ready: list[tuple[str, Action]] = []
+                for key, item in list(self._items.items()):
+                    if item.due > now or not self._settled(key, item, now):
+                        continue
+                    del self._items[key]
+                    ready.append((key, item.action))
+                    if len(ready) == max_items:
+                        break
+                if ready:
+                    return ready
+                next_due = min((item.due for item in self._items.values()), default=None)
+                self._cond.wait(None if next_due is None else max(next_due - now, 0.01))
+            return []
+
+    def _settled(self, key: str, item: Pending, now: float) -> bool:
+        if item.action == "delete":
+            return True
+        stat = size_and_mtime(key)
+        if stat is None:
+            # Gone before it was indexed
+            item.action = "delete"
+            return True
+        if stat != item.stat:
+            # Still being written
+            item.stat = stat
+            item.due = now + self.debounce
+            return False
+        return True
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
 
 
 class ChangeHandler(FileSystemEventHandler):
-    def __init__(self, folder):
+    # Only records what changed, the indexing happens on the watcher's worker thread
+    def __init__(self, folder, queue: EventQueue, rules: IgnoreRules | None = None):
         super().__init__()
-        self.just_created = {}  # path -> timestamp
         self.folder = Path(folder).resolve()
+        self.queue = queue
+        self.rules = rules if rules is not None else IgnoreRules.load(Path(folder))
+
+    def interesting(self, path: str) -> bool:
+        if Path(path).suffix.lower() != ".pdf":
+            return False
+        relative = Path(os.path.relpath(path, self.folder)).as_posix()
+        return not self.rules.ignores(relative)
 
-    
     def not_interesting(self, event):
-        return event.is_directory or Path(event.src_path).suffix.lower() != ".pdf"
+        return event.is_directory or not self.interesting(event.src_path)
 
     def on_created(self, event):
         if self.not_interesting(event):
             return
-        with DBSession() as db_session:
-            index_pdf(db_session, Path(event.src_path), datetime.now().timestamp())
-        self.just_created[event.src_path] = time.time()
+        self.queue.put(event.src_path, "index")
 
     def on_modified(self, event):
         if self.not_interesting(event):
             return
-        # Ignore modified events within 2 seconds of creation
-        created_time = self.just_created.get(event.src_path)
-        if created_time and time.time() - created_time < 2:
-            return
-        # Clean up old entries
-        self.just_created.pop(event.src_path, None)
-        with DBSession() as db_session:
-            index_pdf(db_session, Path(event.src_path), datetime.now().timestamp())
-       
+        self.queue.put(event.src_path, "index")
 
     def on_deleted(self, event):
         if self.not_interesting(event):
             return
-        with DBSession() as db_session:
-            on_delete_file(db_session, Path(event.src_path))
+        self.queue.put(event.src_path, "delete")
 
     def on_moved(self, event):
-        if self.not_interesting(event):
+        # Moving a file into or out of an ignored folder adds or removes it
+        if event.is_directory:
             return
         src_in_folder = str(Path(event.src_path).resolve()).startswith(str(self.folder))
         dest_in_folder = str(Path(event.dest_path).resolve()).startswith(str(self.folder))
-        if src_in_folder and dest_in_folder:
-            with DBSession() as db_session:
-                index_pdf(db_session, Path(event.dest_path), datetime.now().timestamp())
-        elif src_in_folder:
-            with DBSession() as db_session:
-                on_delete_file(db_session, Path(event.src_path))
-        elif dest_in_folder:
+        if src_in_folder and self.interesting(event.src_path):
+            self.queue.put(event.src_path, "delete")
+        if dest_in_folder and self.interesting(event.dest_path):
+            self.queue.put(event.dest_path, "index")
+
+
+class Watcher:
+    # Watchdog feeds the event queue and a single thread drains it. With jobs > 1
+    # the files of a batch are indexed in a process pool. A second, low priority
+    # thread works through the OCR queue whenever there are no changes to apply.
+
+    def __init__(self, folder: Path = Path("."), jobs: int = 1, batch_size: int = config.WATCH_BATCH_SIZE) -> None:
+        self.folder = folder
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.queue = EventQueue()
+        self.observer = Observer()
+        self.catching_up = False
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._ocr_thread = threading.Thread(target=self._run_ocr, daemon=True)
+        self._ocr_wakeup = threading.Event()
+        self._stopping = False
+
+    def start(self, catch_up: bool = True) -> None:
+        self.observer.schedule(ChangeHandler(self.folder, self.queue), str(self.folder), recursive=True)
+        self.observer.start()
+        self._thread.start()
+        self._ocr_wakeup.set()
+        self._ocr_thread.start()
+        if catch_up:
+            # Started after the observer so nothing that changes during the scan is missed
+            self.catching_up = True
+            threading.Thread(target=self.catch_up, daemon=True).start()
+
+    def catch_up(self) -> None:
+        # Queues whatever changed while nothing was watching, by comparing the
+        # stored stat of each row with a listing of the folder
+        lower_thread_priority()
+        try:
             with DBSession() as db_session:
-                index_pdf(db_session, Path(event.dest_path), datetime.now().timestamp())
-            
+                stored = {
+                    row.path: (row.size, row.mtime_ns, row.inode)
+                    for row in db_session.execute(
+                        select(Document.path, Document.size, Document.mtime_ns, Document.inode)
+                    )
+                }
+            errors: list[OSError] = []
+            changed = 0
+            for path, st in walk_pdfs(self.folder, errors.append):
+                if stored.pop(path, None) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                    self.queue.put(path, "index")
+                    changed += 1
+            if errors:
+                # Files in folders that couldn't be listed may still exist
+                logging.warning(f"Catch-up scan skipped deletions, {len(errors)} error(s): {errors[0]}")
+                stored = {}
+            # Queued after the new paths so a moved file is matched to its old row first
+            for path in stored:
+                self.queue.put(path, "delete")
+            logging.info(f"Catch-up scan queued {changed} changed and {len(stored)} deleted file(s)")
+        except Exception as e:
+            logging.error(f"Catch-up scan failed: {e}")
+        finally:
+            self.catching_up = False
+
+    def stop(self) -> None:
+        # A document being OCR'd is not waited for, its job stays queued
+        self._stopping = True
+        self._ocr_wakeup.set()
+        self.observer.stop()
+        self.queue.close()
+        self.observer.join()
+        self._thread.join()
+
+    def status(self) -> str:
+        status = f"{len(self.queue)} change(s) pending, oldest {self.queue.lag:.0f}s ago"
+        return f"Catching up, {status}" if self.catching_up else status
+
+    def _drain(self) -> None:
+        while True:
+            batch = self.queue.take(self.batch_size)
+            if not batch:
+                return
+            try:
+                self._process(batch)
+            except Exception as e:
+                logging.error(f"Error applying {len(batch)} change(s): {e}")
+            self._ocr_wakeup.set()
+
+    def _run_ocr(self) -> None:
+        lower_thread_priority()
+        while not self._stopping:
+            self._ocr_wakeup.wait()
+            self._ocr_wakeup.clear()
+            while not self._stopping:
+                # Changes to the folder go first
+                if len(self.queue):
+                    time.sleep(1)
+                    continue
+                try:
+                    if not ocr_queue.run_next():
+                        break
+                except Exception as e:
+                    logging.error(f"OCR queue: {e}")
+                    break
+
+    def _process(self, batch: list[tuple[str, Action]]) -> None:
+        to_index = [Path(path) for path, action in batch if action == "index"]
+        to_delete = [Path(path) for path, action in batch if action == "delete"]
+        with DBSession() as db_session:
+            reconciler = Reconciler(db_session)
+            # Indexing goes first so a moved file takes over its old row instead of
+            # being deleted and extracted again
+            if self.jobs > 1 and len(to_index) > 1:
+                from pipeline import Pipeline
+                Pipeline(reconciler, self.jobs).run((path, None) for path in to_index)
+            else:
+                for path in to_index:
+                    try:
+                        index_file(reconciler, path)
+                    except OSError as e:
+                        logging.error(f"Error indexing {path}: {e}")
+            for path in to_delete:
+                reconciler.remove(path)
+            reconciler.commit()
+        logging.info(f"Applied {len(batch)} change(s), {self.status()}")
 
 
-def watch_folder() -> None:
-    folder = Path(".")
-    event_handler = ChangeHandler(folder)
-    observer = Observer()
-    observer.schedule(event_handler, str(folder), recursive=True)
-    observer.start()
-    print(f"Watching for changes in: {folder.resolve()}")
+def watch_folder(jobs: int = 1) -> None:
+    watcher = Watcher(Path("."), jobs)
+    watcher.start()
+    print(f"Watching for changes in: {watcher.folder.resolve()}")
     try:
         while True:
-            time.sleep(1)
+            time.sleep(5)
+            if len(watcher.queue) or watcher.catching_up:
+                print(watcher.status())
     except KeyboardInterrupt:
-        observer.stop()
-    observer.join()
\ No newline at end of file
+        watcher.stop()